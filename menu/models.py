@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from utils import get_input
+from utils import get_input, scripted_input
 
 
 class Node(ABC):
@@ -57,6 +57,10 @@ class MenuNode(Node):
 
     @abstractmethod
     def __call__(self):
+        """
+        Show this menu and return the node to open next,
+        or None to go back to the parent.
+        """
         pass
 
     @classmethod
@@ -92,14 +96,7 @@ class ListMenu(MenuNode):
         user_choice = get_input("Select (0 to Return): ", target_type=self.user_choice_type)
         
         print('\n------------------------')
-        (user_choice or self.parent or exit)()
-        # if user_choice:
-        #     user_choice()
-        # else:
-        #     if self.parent:
-        #         self.parent()
-        #     else:
-        #         exit()
+        return user_choice
 
     @classmethod
     def from_dict(cls, data, parent=None):
@@ -145,7 +142,7 @@ class PageMenu(MenuNode):
         print('\n------------------------\n')
         
         # go back parent
-        self.parent()
+        return None
 
 
     @classmethod
@@ -160,6 +157,36 @@ class PageMenu(MenuNode):
 
 
 
+def run_menu(root: MenuNode, inputs=None) -> None:
+    """
+    Navigate a menu tree until the user returns from the root.
+
+    Nodes are kept on an explicit stack instead of calling each other, so
+    sessions of any length use constant stack depth and memory.
+
+    Args:
+    - root (MenuNode): The top level menu.
+    - inputs (Iterable[str]): Optional scripted answers to use instead of
+      the keyboard; the session ends when they run out.
+    """
+
+    if inputs is not None:
+        with scripted_input(inputs):
+            return run_menu(root)
+
+    stack = [root]
+    try:
+        while stack:
+            next_node = stack[-1]()
+            if next_node is None:
+                stack.pop()
+            else:
+                stack.append(next_node)
+    except EOFError:
+        # end of piped or scripted input
+        print()
+
+
 def generate_menu_from_dict(data:dict, parent=None):
     if action:=data.get('action'):
         return PageMenu(action, data.get('name'), data.get('description'), parent)
@@ -1,19 +1,55 @@
+import builtins
+import getpass
+from contextlib import contextmanager
+
+
 def get_input(prompt, retry=True, target_type=str):
     """
     Get and Return user inputs after validating them
     """
     assert callable(target_type)
 
+    while True:
+        try:
+            user_input = input(prompt)  # if Ctrl+C -> raise KeyboardInterrupt
+            return target_type(user_input)
+        except KeyboardInterrupt:
+            print("\nForce Exit...")
+            exit(0)
+        except EOFError:
+            # no more input (piped or scripted), let the caller finish
+            raise
+        except Exception as err:
+            if retry:
+                print("Invalid input, try again")
+            else:
+                raise TypeError("Invalid input, try again") from err  # NewException -> err
+
+
+@contextmanager
+def scripted_input(lines):
+    """
+    Answer input() and getpass.getpass() calls from lines instead of the
+    keyboard, echoing each answer except passwords. EOFError is raised once
+    lines run out.
+    """
+    lines = iter(lines)
+
+    def read(prompt='', echo=True):
+        print(prompt, end='')
+        try:
+            line = next(lines)
+        except StopIteration:
+            raise EOFError from None
+        print(line if echo else '')
+        return line
+
+    def read_password(prompt='Password: ', stream=None):
+        return read(prompt, echo=False)
+
+    original_input, original_getpass = builtins.input, getpass.getpass
+    builtins.input, getpass.getpass = read, read_password
     try:
-        user_input = input(prompt)  # if Ctrl+C -> raise KeyboardInterrupt
-        user_input = target_type(user_input)
-    except KeyboardInterrupt:
-        print("\nForce Exit...")
-        exit(0)
-    except Exception as err:
-        if retry:
-            print("Invalid input, try again")
-            return get_input(prompt, retry, target_type)
-        else:
-            raise TypeError("Invalid input, try again") from err  # NewException -> err
-    return user_input
+        yield
+    finally:
+        builtins.input, getpass.getpass = original_input, original_getpass
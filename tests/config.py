@@ -4,15 +4,72 @@ USER:str = 'postgres'
 PASSWORD:str = 'postgres'
 HOST:str = 'localhost'
 PORT:str = '5432'
+# optional read replica for analytics queries, e.g. 'host=localhost port=5433 dbname=postgres user=postgres password=postgres'
+REPLICA_DSN:str = None
+# connections per pool, threads beyond it wait for a free one
+DB_POOL_SIZE:int = 20
 
 #API constants
 API_KEY:str = '0a055debed6addca54f8da5d868e543d'
+# upstream is always queried in CANONICAL_UNIT (kelvin) and stored that way,
+# API_UNIT is the default unit served to clients
+CANONICAL_UNIT:str = 'standard'
 API_UNIT:str = 'metric'
+WEATHER_REFRESH_INTERVAL:int = 600
+HISTORY_MAX_POINTS:int = 500
+
+#upstream providers, tried in rotation
+UPSTREAM_URLS:list = ['http://api.openweathermap.org/data/2.5/weather']
+UPSTREAM_MIN_TIMEOUT:float = 1
+UPSTREAM_MAX_TIMEOUT:float = 8
+UPSTREAM_TIMEOUT_FACTOR:float = 2
+UPSTREAM_LATENCY_WINDOW:int = 500
+UPSTREAM_MIN_SAMPLES:int = 20
+UPSTREAM_HEDGE:bool = False
+UPSTREAM_HEDGE_RATIO:float = 0.05
+UPSTREAM_MAX_HEDGE_BURST:int = 10
+UPSTREAM_MAX_WORKERS:int = 32
+
+#admission control, per route class
+ADMISSION_LIMITS:dict = {'weather': 16, 'admin': 4}
+ADMISSION_QUEUE:dict = {'weather': 64, 'admin': 8}
+ADMISSION_DEFAULT_DEADLINE:float = 10
+ADMISSION_INITIAL_SERVICE_TIME:float = 0.5
+ADMISSION_SMOOTHING:float = 0.1
+
+#coordinate lookups
+GEO_GRID_RESOLUTION:float = 0.1
+GEO_CACHE_SIZE:int = 10000
 
 #urls
 ADMIN_URL:str = 'http://localhost:8000/admin/'
 WEATHER_URL:str = 'http://localhost:8000/weather/'
 
+#admin auth
+ADMIN_SECRET:str = None
+ADMIN_SESSION_TTL:int = 3600
+ADMIN_PASS_CACHE_TTL:int = 300
+ADMIN_PASS_CACHE_SIZE:int = 1024
+ADMIN_HASH_ITERATIONS:int = 20000
+
+#bulk export
+EXPORT_CHUNK_SIZE:int = 64 * 1024
+
 #log file path
 LOG_FILE:str = 'HW12/server.log'
 
+#streaming analytics
+SKETCH_DIR:str = 'HW12/sketches'
+SKETCH_CHECKPOINT_INTERVAL:int = 60
+SKETCH_TOP_K:int = 10
+
+#client cache
+CLIENT_CACHE_SIZE:int = 128
+CLIENT_CACHE_DIR:str = None
+
+#tracing and profiling
+TRACING:bool = False
+SLOW_REQUEST_THRESHOLD:float = 1.0
+SLOW_LOG_SIZE:int = 100
+PROFILE_DEFAULT_REQUESTS:int = 100
+PROFILE_REPORT_LINES:int = 30
@@ -0,0 +1,63 @@
+import unittest
+import threading
+import time
+import sys
+import os
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from admission import AdmissionController, Shed
+
+
+
+class TestAdmissionController(unittest.TestCase):
+    def hold(self, controller, started, release):
+        with controller.admit(time.monotonic() + 10):
+            started.set()
+            release.wait()
+
+    def test_sheds_when_queue_is_full(self):
+        controller = AdmissionController(limit=1, max_queue=0)
+        started, release = threading.Event(), threading.Event()
+        worker = threading.Thread(target=self.hold, args=(controller, started, release))
+        worker.start()
+        started.wait()
+
+        with self.assertRaises(Shed) as cm:
+            with controller.admit(time.monotonic() + 10):
+                pass
+        release.set()
+        worker.join()
+
+        self.assertGreaterEqual(cm.exception.retry_after, 1)
+        self.assertEqual(controller.stats()['shed'], 1)
+
+    def test_sheds_when_deadline_is_too_close(self):
+        controller = AdmissionController(limit=1, max_queue=10)
+        controller.service_time = 5
+        started, release = threading.Event(), threading.Event()
+        worker = threading.Thread(target=self.hold, args=(controller, started, release))
+        worker.start()
+        started.wait()
+
+        with self.assertRaises(Shed):
+            with controller.admit(time.monotonic() + 1):
+                pass
+        release.set()
+        worker.join()
+
+    def test_queued_request_runs_when_slot_frees(self):
+        controller = AdmissionController(limit=1, max_queue=1)
+        started, release = threading.Event(), threading.Event()
+        worker = threading.Thread(target=self.hold, args=(controller, started, release))
+        worker.start()
+        started.wait()
+        threading.Timer(0.05, release.set).start()
+
+        with controller.admit(time.monotonic() + 5):
+            self.assertEqual(controller.stats()['active'], 1)
+        worker.join()
+        self.assertEqual(controller.stats()['shed'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
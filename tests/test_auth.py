@@ -0,0 +1,54 @@
+import unittest
+import sys
+import os
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from auth import PasswordCache, issue_token, verify_token
+
+
+
+class TestSessionToken(unittest.TestCase):
+    def test_valid_token(self):
+        self.assertEqual(verify_token(issue_token("admin")), "admin")
+
+    def test_expired_token(self):
+        self.assertIsNone(verify_token(issue_token("admin", ttl=-1)))
+
+    def test_tampered_token(self):
+        token = issue_token("admin")
+        payload, signature = token.split('.')
+        forged = issue_token("root").split('.')[0]
+        self.assertIsNone(verify_token(f"{forged}.{signature}"))
+        self.assertIsNone(verify_token("garbage"))
+
+    def test_non_ascii_token(self):
+        self.assertIsNone(verify_token("YWRtaW46MQ.\u00e9"))
+        self.assertIsNone(verify_token("\u00e9.\u00e9"))
+
+
+class TestPasswordCache(unittest.TestCase):
+    def test_checks_and_caches(self):
+        lookups = []
+        def fetch(username):
+            lookups.append(username)
+            return 'secret' if username == 'admin' else None
+
+        passwords = PasswordCache(fetch)
+
+        self.assertTrue(passwords.check('admin', 'secret'))
+        self.assertFalse(passwords.check('admin', 'wrong'))
+        self.assertFalse(passwords.check('nobody', 'secret'))
+        self.assertFalse(passwords.check('nobody', 'secret'))
+        self.assertEqual(lookups, ['admin', 'nobody'])
+
+    def test_unknown_usernames_are_bounded(self):
+        passwords = PasswordCache(lambda username: None, max_entries=10)
+        for i in range(100):
+            passwords.check(f'user{i}', 'secret')
+
+        self.assertEqual(len(passwords.entries), 10)
+        self.assertIn('user99', passwords.entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import tempfile
+import datetime
+import time
+import sys
+import os
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from client_cache import CacheEntry, ResponseCache, freshness
+
+
+
+class TestFreshness(unittest.TestCase):
+    def test_max_age(self):
+        expires = freshness({'Cache-Control': 'max-age=60'}, {'status': 200})
+        self.assertAlmostEqual(expires, time.time() + 60, delta=1)
+
+    def test_no_store(self):
+        self.assertIsNone(freshness({'Cache-Control': 'no-store'}, {'status': 200}))
+
+    def test_last_update_fallback(self):
+        last_update = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        expires = freshness({}, {'status': 200, 'last_update': last_update})
+        self.assertGreater(expires, time.time())
+
+    def test_error_not_cached(self):
+        self.assertIsNone(freshness({}, {'status': 404}))
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2, cache_dir=None)
+        cache.set("Tehran", CacheEntry({'temp': 1}))
+        cache.set("London", CacheEntry({'temp': 2}))
+        cache.get("tehran")
+        cache.set("Paris", CacheEntry({'temp': 3}))
+
+        self.assertIsNotNone(cache.get("Tehran"))
+        self.assertIsNone(cache.get("London"))
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ResponseCache(cache_dir=cache_dir).set("Tehran", CacheEntry({'temp': 1}, '"abc"', time.time() + 60))
+            entry = ResponseCache(cache_dir=cache_dir).get("Tehran")
+
+            self.assertEqual(entry.data, {'temp': 1})
+            self.assertEqual(entry.etag, '"abc"')
+            self.assertTrue(entry.fresh)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,15 @@
 import unittest
 import datetime
+import io
+import json
 import psycopg2
+import threading
+from unittest import mock
 import os
 import sys
 # sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
 # from weather_database import WeatherDatabase
-from ..weather_project.weather_database import WeatherDatabase
+from ..weather_project.weather_database import WeatherDatabase, PooledConnection
 
 class TestWeatherDatabase(unittest.TestCase):
     
@@ -15,11 +19,12 @@ class TestWeatherDatabase(unittest.TestCase):
         self.db.create_tables()
     
     def tearDown(self):
-        cur = self.db.conn.cursor()
-        cur.execute("DROP TABLE response")
-        cur.execute("DROP TABLE request")
-        self.db.conn.commit()
-        self.db.conn.close()
+        with self.db.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DROP TABLE observation")
+            cur.execute("DROP TABLE response")
+            cur.execute("DROP TABLE request")
+        self.db.close_conn()
         
     def test_save_request_data(self):
         # Save a request for a city
@@ -38,9 +43,10 @@ class TestWeatherDatabase(unittest.TestCase):
         self.db.save_response_data(request_id, response_data)
         
         # check that the response was saved successfully
-        cur = self.db.conn.cursor()
-        cur.execute("SELECT data FROM response WHERE request_id = %s", (request_id,))
-        result = cur.fetchone()[0]
+        with self.db.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT data FROM response WHERE request_id = %s", (request_id,))
+            result = cur.fetchone()[0]
         self.assertEqual(result, response_data)
         
     def test_get_request_count(self):
@@ -111,6 +117,168 @@ class TestWeatherDatabase(unittest.TestCase):
         self.assertIn(('London', 2), results)
         self.assertIn(('Paris', 1), results)
         self.assertIn(('New York', 1), results)
+
+    def test_coordinate_requests_are_not_cities(self):
+        request_time = datetime.datetime.now().isoformat()
+        city_id = self.db.save_request_data('London', request_time)
+        coord_id = self.db.save_coord_request_data(35.7, 51.4, request_time)
+        self.db.save_response_data(city_id, {'status': 200})
+        self.db.save_response_data(coord_id, {'status': 200})
+
+        self.assertEqual(self.db.get_request_count(), 2)
+        self.assertEqual(self.db.get_city_request_count(), [('London', 1)])
+        self.assertEqual([city for city, dt in self.db.get_last_hour_requests()], ['London'])
+
+        output = io.BytesIO()
+        self.db.export_requests(output, datetime.datetime.min, datetime.datetime.max, fmt='jsonl')
+        rows = [json.loads(line) for line in output.getvalue().decode().splitlines()]
+        self.assertEqual([(row['city'], row['lat'], row['lon']) for row in rows],
+                         [('London', None, None), (None, 35.7, 51.4)])
+
+    def test_save_observation_deduplicates(self):
+        weather = {'temp': 20.5, 'feels_like_temp': 19.0, 'last_update': '2023-06-22 15:40:00', 'status': 200}
+        self.db.save_observation('London', weather)
+        self.db.save_observation('london', weather)
+
+        with self.db.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM observation WHERE city = 'london'")
+            self.assertEqual(cur.fetchone()[0], 1)
+
+    def test_get_city_history(self):
+        # four observations, ten minutes apart
+        start = datetime.datetime(2023, 6, 22, 15, 0, 0)
+        for i, temp in enumerate((10, 20, 30, 40)):
+            observed_at = start + datetime.timedelta(minutes=10 * i)
+            self.db.save_observation('London', {'temp': temp, 'feels_like_temp': temp - 1,
+                                                'last_update': observed_at.isoformat(), 'status': 200})
+
+        results = self.db.get_city_history('London', start, start + datetime.timedelta(hours=1), 1200)
+
+        # Check that the observations were averaged into 20 minute buckets
+        self.assertEqual(results, [('2023-06-22 15:00:00', 15, 14),
+                                   ('2023-06-22 15:20:00', 35, 34)])
+
+    def test_export_requests(self):
+        request_time = datetime.datetime.now()
+        request_id = self.db.save_request_data('London', request_time.isoformat())
+        self.db.save_response_data(request_id, {'status': 200, 'note': 'a\\b "quoted"'})
+        self.db.save_request_data('Paris', (request_time - datetime.timedelta(days=2)).isoformat())
+
+        output = io.BytesIO()
+        self.db.export_requests(output, request_time - datetime.timedelta(days=1),
+                                request_time + datetime.timedelta(days=1), fmt='jsonl')
+        rows = [json.loads(line) for line in output.getvalue().decode().splitlines()]
+
+        # Check that only the request in range was exported, with its response intact
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['city'], 'London')
+        self.assertEqual(rows[0]['response'], {'status': 200, 'note': 'a\\b "quoted"'})
+
+    def test_insert_is_prepared_once(self):
+        request_time = datetime.datetime.now().isoformat()
+        self.db.save_request_data('London', request_time)
+        self.db.save_request_data('Paris', request_time)
+
+        with self.db.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM pg_prepared_statements WHERE name = 'save_request'")
+            self.assertEqual(cur.fetchone()[0], 1)
+
+    def test_reads_fall_back_to_primary(self):
+        # point the replica at a port nothing listens on
+        self.db.close_conn()
+        self.db.connect_database(database="testweather", replica_dsn="host=localhost port=1 dbname=testweather")
+        self.db.save_request_data('London', datetime.datetime.now().isoformat())
+
+        self.assertEqual(self.db.get_request_count(), 1)
+
+    def test_reads_issue_no_commit(self):
+        self.db.save_request_data('London', datetime.datetime.now().isoformat())
+        with mock.patch.object(PooledConnection, 'commit') as commit:
+            for _ in range(5):
+                self.db.get_request_count()
+            with self.db.read_connection() as conn:
+                self.assertTrue(conn.autocommit)
+        commit.assert_not_called()
+
+        # the primary connection is switched back for writes
+        with self.db.connection() as conn:
+            self.assertFalse(conn.autocommit)
+
+    def test_replica_reads_are_read_only_autocommit(self):
+        self.db.close_conn()
+        self.db.connect_database(database="testweather",
+                                 replica_dsn="host=localhost dbname=testweather user=postgres password=postgres")
+        with mock.patch.object(PooledConnection, 'commit') as commit:
+            self.assertEqual(self.db.get_request_count(), 0)
+            with self.db.read_connection() as conn:
+                self.assertTrue(conn.autocommit)
+                self.assertTrue(conn.readonly)
+        commit.assert_not_called()
+
+    def test_reads_fall_back_when_replica_drops(self):
+        self.db.close_conn()
+        self.db.connect_database(database="testweather",
+                                 replica_dsn="host=localhost dbname=testweather user=postgres password=postgres application_name=replica")
+        self.db.save_request_data('London', datetime.datetime.now().isoformat())
+        self.assertEqual(self.db.get_request_count(), 1)
+
+        # kill the pooled replica connection under the database's feet
+        with self.db.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE application_name = 'replica'")
+            self.assertEqual(cur.fetchall(), [(True,)])
+
+        self.assertEqual(self.db.get_request_count(), 1)
+        self.assertEqual(self.db.get_request_count(), 1)
+
+    def test_failed_export_leaves_reads_working(self):
+        class BrokenOutput:
+            def write(self, data):
+                raise BrokenPipeError
+
+        self.db.save_request_data('London', datetime.datetime.now().isoformat())
+        with self.assertRaises(BrokenPipeError):
+            self.db.export_requests(BrokenOutput(), datetime.datetime.min, datetime.datetime.max)
+
+        self.assertEqual(self.db.get_request_count(), 1)
+
+    def test_failed_write_is_rolled_back(self):
+        # no request with this id, the foreign key rejects it
+        with self.assertRaises(psycopg2.IntegrityError):
+            self.db.save_response_data(10 ** 9, {'status': 200})
+
+        request_id = self.db.save_request_data('London', datetime.datetime.now().isoformat())
+        self.db.save_response_data(request_id, {'status': 200})
+        self.assertEqual(self.db.get_successful_request_count(), 1)
+
+    def test_connections_are_reused(self):
+        with self.db.connection() as first, self.db.connection() as second:
+            pids = {first.get_backend_pid(), second.get_backend_pid()}
+
+        # both went back to the pool open, not just the first one
+        with self.db.connection() as first, self.db.connection() as second:
+            self.assertEqual({first.get_backend_pid(), second.get_backend_pid()}, pids)
+
+    def test_concurrent_writes(self):
+        # fewer connections than threads, so threads have to wait for one
+        self.db.close_conn()
+        self.db.connect_database(database="testweather", pool_size=2)
+
+        def save(city):
+            for _ in range(20):
+                request_id = self.db.save_request_data(city, datetime.datetime.now().isoformat())
+                self.db.save_response_data(request_id, {'status': 200})
+
+        threads = [threading.Thread(target=save, args=(f'city{i}',)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.db.get_request_count(), 160)
+        self.assertEqual(sorted(self.db.get_city_request_count()), [(f'city{i}', 20) for i in range(8)])
         
         
 if __name__ == '__main__':
@@ -0,0 +1,78 @@
+import unittest
+import threading
+import time
+import sys
+import os
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from geo_cache import GeoGridCache
+
+
+
+class TestGeoGridCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def fetch(self, lat, lon):
+        self.calls.append((lat, lon))
+        time.sleep(0.05)
+        return {'status': 200, 'temp': 20.0}
+
+    def test_nearby_points_share_a_cell(self):
+        cache = GeoGridCache(resolution=0.1)
+        cache.get(35.701, 51.401, self.fetch)
+        cache.get(35.799, 51.499, self.fetch)
+
+        self.assertEqual(self.calls, [(35.75, 51.45)])
+
+    def test_centers_stay_in_range(self):
+        for resolution in (0.1, 0.7, 1):
+            cache = GeoGridCache(resolution=resolution)
+            for lat, lon in ((90, 180), (-90, -180), (89.99, 179.99)):
+                center_lat, center_lon = cache.center(cache.cell(lat, lon))
+                self.assertTrue(-90 <= center_lat <= 90 and -180 <= center_lon <= 180, (resolution, lat, lon))
+
+    def test_concurrent_misses_are_coalesced(self):
+        cache = GeoGridCache(resolution=0.1)
+        threads = [threading.Thread(target=cache.get, args=(35.7, 51.4, self.fetch)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.calls), 1)
+
+    def test_waiters_keep_their_deadline(self):
+        cache = GeoGridCache(resolution=0.1)
+        slow = threading.Thread(target=cache.get, args=(35.7, 51.4, lambda lat, lon: time.sleep(0.5) or {'status': 200}))
+        slow.start()
+        time.sleep(0.05)
+
+        start = time.monotonic()
+        weather = cache.get(35.7, 51.4, self.fetch, timeout=0.05)
+        waited = time.monotonic() - start
+        slow.join()
+
+        self.assertEqual(weather, {'status': 504})
+        self.assertLess(waited, 0.4)
+        self.assertEqual(self.calls, [])
+
+    def test_eviction(self):
+        cache = GeoGridCache(resolution=1, max_cells=2)
+        for lat in (10, 20, 30):
+            cache.get(lat, 0, self.fetch)
+        cache.get(10, 0, self.fetch)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_errors_are_not_cached(self):
+        cache = GeoGridCache(resolution=1)
+        cache.get(0, 0, lambda lat, lon: {'status': 500})
+        cache.get(0, 0, self.fetch)
+
+        self.assertEqual(len(self.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
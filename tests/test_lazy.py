@@ -0,0 +1,78 @@
+import unittest
+import logging
+import subprocess
+import tempfile
+import sys
+import os
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from lazy import per_process
+from logger import Logger
+
+
+WEATHER_PROJECT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project'))
+
+IMPORT_SCRIPT = f"""
+import os, sys
+sys.path.insert(0, {WEATHER_PROJECT!r})
+import psycopg2, requests
+def connect(*args, **kwargs):
+    raise AssertionError("connected to the database at import")
+psycopg2.connect = connect
+before = set(os.listdir('/proc/self/fd'))
+import weather_server
+print(len(set(os.listdir('/proc/self/fd')) - before))
+"""
+
+
+class TestPerProcess(unittest.TestCase):
+    def test_created_once_per_process(self):
+        calls = []
+        get = per_process(lambda: calls.append(os.getpid()) or object())
+
+        self.assertIs(get(), get())
+        self.assertEqual(len(calls), 1)
+
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write, b'1' if get() is not get() or len(calls) != 2 else b'0')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), b'0')
+
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        # start without the handler an earlier test's get_logger() may have added
+        logger = logging.getLogger('logger')
+        handlers = logger.handlers[:]
+        logger.handlers.clear()
+        self.addCleanup(logger.handlers.extend, handlers)
+        self.addCleanup(logger.handlers.clear)
+
+    def test_one_handler_per_logger(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_file = os.path.join(log_dir, 'server.log')
+            first = Logger(log_file)
+            handlers = list(first.logger.handlers)
+            # what a forked worker does through per_process
+            Logger(log_file).info("hello")
+
+            self.assertEqual(first.logger.handlers, handlers)
+            self.assertEqual(len(handlers), 1)
+
+
+class TestImport(unittest.TestCase):
+    def test_import_opens_nothing(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            result = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], cwd=cwd,
+                                    capture_output=True, text=True)
+
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout.strip(), '0')
+            self.assertEqual(os.listdir(cwd), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
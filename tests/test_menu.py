@@ -0,0 +1,52 @@
+import unittest
+import contextlib
+import getpass
+import io
+import sys
+import os
+# inserts the menu dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../menu')))
+from models import generate_menu_from_dict, run_menu
+
+
+
+class TestRunMenu(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.menu = generate_menu_from_dict({
+            'name': 'Root',
+            'children': [
+                {'name': 'Action', 'action': lambda: self.calls.append(input())},
+                {'name': 'Sub', 'children': [{'name': 'Nested', 'action': lambda: self.calls.append('nested')}]},
+            ]})
+
+    def run_script(self, inputs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_menu(self.menu, inputs)
+
+    def test_scripted_navigation(self):
+        self.run_script(['1', 'hello', '2', '1', '0', '0'])
+        self.assertEqual(self.calls, ['hello', 'nested'])
+
+    def test_long_session_does_not_recurse(self):
+        self.run_script(['2', '1', '0'] * (sys.getrecursionlimit() * 2) + ['0'])
+        self.assertEqual(len(self.calls), sys.getrecursionlimit() * 2)
+
+    def test_ends_when_input_runs_out(self):
+        self.run_script(['2', '1'])
+        self.assertEqual(self.calls, ['nested'])
+
+    def test_scripted_password(self):
+        menu = generate_menu_from_dict({
+            'name': 'Root',
+            'children': [{'name': 'Login', 'action': lambda: self.calls.append(getpass.getpass("Password: "))}]})
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_menu(menu, ['1', 'secret', '0'])
+
+        self.assertEqual(self.calls, ['secret'])
+        self.assertNotIn('secret', output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
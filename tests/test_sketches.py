@@ -0,0 +1,94 @@
+import unittest
+import tempfile
+import subprocess
+import sys
+import os
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from sketches import HyperLogLog, TopK, CityStats
+
+
+
+class TestHyperLogLog(unittest.TestCase):
+    def test_count_is_close(self):
+        hll = HyperLogLog()
+        for i in range(5000):
+            hll.add(f"city-{i}")
+            hll.add(f"city-{i}")
+
+        self.assertAlmostEqual(hll.count(), 5000, delta=5000 * 0.05)
+
+    def test_merge(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(1000):
+            first.add(f"city-{i}")
+            second.add(f"city-{i + 500}")
+        first.merge(second)
+
+        self.assertAlmostEqual(first.count(), 1500, delta=1500 * 0.05)
+
+    def test_round_trip(self):
+        hll = HyperLogLog()
+        hll.add("tehran")
+        self.assertEqual(HyperLogLog.from_dict(hll.to_dict()).registers, hll.registers)
+
+
+class TestTopK(unittest.TestCase):
+    def test_heavy_hitters(self):
+        top = TopK(k=3)
+        for i in range(200):
+            top.add(f"noise-{i}")
+        for city, count in (("tehran", 50), ("london", 30), ("paris", 20)):
+            for _ in range(count):
+                top.add(city)
+
+        names = [city for city, count in top.top()]
+        self.assertEqual(names, ["tehran", "london", "paris"])
+
+    def test_merge(self):
+        first, second = TopK(k=2), TopK(k=2)
+        for _ in range(5):
+            first.add("tehran")
+            second.add("london")
+        for _ in range(3):
+            second.add("tehran")
+        first.merge(second)
+
+        self.assertEqual(first.top(), [("tehran", 8), ("london", 5)])
+
+
+class TestCityStats(unittest.TestCase):
+    def test_merges_worker_checkpoints(self):
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            stats = CityStats(checkpoint_dir=checkpoint_dir, interval=3600)
+            stats.record("Tehran")
+            stats.record("tehran")
+            stats.checkpoint()
+            os.rename(stats.checkpoint_path, os.path.join(checkpoint_dir, "sketch-0.json"))
+
+            stats = CityStats(checkpoint_dir=checkpoint_dir, interval=3600)
+            stats.record("London")
+
+            self.assertEqual(stats.distinct_cities(), 2)
+            self.assertEqual(stats.top_cities(), [("tehran", 2), ("london", 1)])
+
+    def test_exited_workers_are_compacted(self):
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            for city in ("Tehran", "London"):
+                stats = CityStats(checkpoint_dir=checkpoint_dir, interval=3600)
+                stats.record(city)
+                stats.checkpoint()
+                worker = subprocess.Popen([sys.executable, "-c", ""])
+                worker.wait()
+                os.rename(stats.checkpoint_path, os.path.join(checkpoint_dir, f"sketch-{worker.pid}.json"))
+
+            stats = CityStats(checkpoint_dir=checkpoint_dir, interval=3600)
+
+            self.assertEqual(sorted(name for name in os.listdir(checkpoint_dir) if name.endswith(".json")),
+                             ["sketch-base.json"])
+            self.assertEqual(stats.distinct_cities(), 2)
+            self.assertEqual(dict(stats.top_cities()), {"tehran": 1, "london": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import time
+import sys
+import os
+from unittest import mock
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+import config as C
+import tracing
+from tracing import span
+
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.tracing, self.threshold = C.TRACING, C.SLOW_REQUEST_THRESHOLD
+        tracing.slow_requests.clear()
+        tracing.profiler.arm(0)
+
+    def tearDown(self):
+        C.TRACING, C.SLOW_REQUEST_THRESHOLD = self.tracing, self.threshold
+
+    def slow_handler(self):
+        with span('upstream'):
+            time.sleep(0.02)
+        with span('encode'):
+            pass
+
+    def test_span_is_noop_outside_a_trace(self):
+        self.assertIs(span('a'), span('b'))
+        with span('a'):
+            pass
+
+    def test_disabled_records_nothing(self):
+        C.TRACING, C.SLOW_REQUEST_THRESHOLD = False, 0
+        tracing.handle('GET /weather/tehran', self.slow_handler)
+
+        self.assertEqual(tracing.get_slow_requests(), [])
+
+    def test_slow_request_breakdown(self):
+        C.TRACING, C.SLOW_REQUEST_THRESHOLD = True, 0.01
+        with mock.patch.object(tracing, 'get_logger') as get_logger:
+            tracing.handle('GET /weather/tehran', self.slow_handler)
+            tracing.handle('GET /weather/fast', lambda: None)
+
+        get_logger().warning.assert_called_once()
+
+        slow = tracing.get_slow_requests()
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0]['request'], 'GET /weather/tehran')
+        self.assertGreaterEqual(slow[0]['spans_ms']['upstream'], 20)
+        self.assertIn('encode', slow[0]['spans_ms'])
+        self.assertIn('other', slow[0]['spans_ms'])
+
+    def test_profiler_captures_next_n_requests(self):
+        C.TRACING = False
+        tracing.profiler.arm(2)
+        for _ in range(3):
+            tracing.handle('GET /weather/tehran', self.slow_handler)
+
+        report = tracing.profiler.report()
+        self.assertEqual(report['profiled'], 2)
+        self.assertEqual(report['remaining'], 0)
+        self.assertIn('slow_handler', report['report'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+import sys
+import os
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from units import convert_many, convert_weather
+
+
+
+class TestUnits(unittest.TestCase):
+    def test_convert_many(self):
+        self.assertEqual(convert_many([273.15, 373.15], 'metric'), [0, 100])
+        self.assertEqual(convert_many([273.15, 373.15], 'imperial'), [32, 212])
+        self.assertEqual(convert_many([273.15], 'standard'), [273.15])
+
+    def test_convert_weather(self):
+        weather = {'temp': 291.65, 'feels_like_temp': 289.45, 'last_update': '2023-06-22 15:40:00',
+                   'units': 'standard', 'status': 200}
+        converted = convert_weather(weather, 'metric')
+
+        self.assertEqual(converted['temp'], 18.5)
+        self.assertEqual(converted['feels_like_temp'], 16.3)
+        self.assertEqual(converted['units'], 'metric')
+        # the cached canonical response is left untouched
+        self.assertEqual(weather['temp'], 291.65)
+
+    def test_errors_pass_through(self):
+        self.assertEqual(convert_weather({'status': 404}, 'imperial'), {'status': 404})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock
+import socket
+import threading
+import time
+import sys
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+import config as C
+from upstream import Upstream
+
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    """
+    /ok answers 200, /broken answers 503.
+    """
+
+    def do_GET(self):
+        self.send_response(503 if self.path.startswith('/broken') else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class TestUpstream(unittest.TestCase):
+    def make_upstream(self, latency, **kwargs):
+        upstream = Upstream(urls=['http://slow', 'http://fast'], **kwargs)
+        for _ in range(C.UPSTREAM_MIN_SAMPLES):
+            upstream.latency.record(latency)
+        return upstream
+
+    def test_timeout_follows_latency(self):
+        upstream = Upstream()
+        self.assertEqual(upstream.timeout(), C.UPSTREAM_MAX_TIMEOUT)
+
+        upstream = self.make_upstream(0.6)
+        self.assertAlmostEqual(upstream.timeout(), 0.6 * C.UPSTREAM_TIMEOUT_FACTOR)
+
+    def test_hedged_request_wins(self):
+        def get(url, timeout):
+            if url.startswith('http://slow'):
+                time.sleep(0.5)
+            return MagicMock(status_code=200, url=url)
+
+        upstream = self.make_upstream(0.05, hedge=True, hedge_ratio=1)
+        upstream.session.get = get
+
+        response = upstream.get('q=Tehran')
+        self.assertTrue(response.url.startswith('http://fast'))
+
+    def test_hedging_is_capped(self):
+        upstream = self.make_upstream(0.05, hedge=True, hedge_ratio=0.5)
+        upstream.session.get = MagicMock(return_value=MagicMock(status_code=200))
+
+        self.assertFalse(upstream._take_hedge())
+        upstream.get('q=Tehran')
+        upstream.get('q=Tehran')
+        self.assertTrue(upstream._take_hedge())
+        self.assertFalse(upstream._take_hedge())
+
+
+class TestFailover(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('localhost', 0), ProviderHandler)
+        cls.url = f'http://localhost:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_unreachable_provider_fails_over(self):
+        upstream = Upstream(urls=[f'http://localhost:{closed_port()}/ok', f'{self.url}/ok'])
+
+        # every request succeeds, whichever provider it starts at
+        for _ in range(4):
+            self.assertEqual(upstream.get('q=Tehran', timeout=2).status_code, 200)
+
+    def test_server_error_fails_over(self):
+        upstream = Upstream(urls=[f'{self.url}/broken', f'{self.url}/ok'])
+
+        for _ in range(4):
+            self.assertEqual(upstream.get('q=Tehran', timeout=2).status_code, 200)
+
+    def test_all_unreachable(self):
+        upstream = Upstream(urls=[f'http://localhost:{closed_port()}/ok'])
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            upstream.get('q=Tehran', timeout=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
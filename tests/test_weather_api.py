@@ -0,0 +1,122 @@
+import unittest
+import asyncio
+import io
+import json
+import threading
+import time
+import sys
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+from weather_api import WeatherClient, AsyncWeatherClient
+from weather_client import stream_weather
+
+
+
+class FakeWeatherHandler(BaseHTTPRequestHandler):
+    """
+    /weather/<city> answers 200, except:
+    - 'flaky' answers 503 to its first two requests
+    - 'loop' redirects to itself forever
+    """
+
+    lock = threading.Lock()
+    hits = {}
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_GET(self):
+        city = self.path.rsplit('/', 1)[-1]
+        cls = type(self)
+        with cls.lock:
+            cls.hits[city] = cls.hits.get(city, 0) + 1
+            hits = cls.hits[city]
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(0.02)
+            if city == 'loop':
+                self.send_response(302)
+                self.send_header('Location', self.path)
+                self.end_headers()
+                return
+            status = 503 if city == 'flaky' and hits <= 2 else 200
+            body = json.dumps({'status': status, 'temp': 20.0}).encode()
+            self.send_response(status)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWeatherClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('localhost', 0), FakeWeatherHandler)
+        cls.base_url = f'http://localhost:{cls.server.server_address[1]}/weather/'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeWeatherHandler.hits = {}
+        FakeWeatherHandler.max_in_flight = 0
+
+    def test_retries_with_backoff(self):
+        with WeatherClient(self.base_url, retries=3, backoff=0.01) as client:
+            weather = client.get_weather('flaky')
+
+        self.assertEqual(weather['status'], 200)
+        self.assertEqual(FakeWeatherHandler.hits['flaky'], 3)
+
+    def test_gives_up_after_retries(self):
+        with WeatherClient(self.base_url, retries=1, backoff=0.01) as client:
+            weather = client.get_weather('flaky')
+
+        self.assertEqual(weather['status'], 503)
+        self.assertEqual(FakeWeatherHandler.hits['flaky'], 2)
+
+    def test_async_concurrency_is_bounded(self):
+        async def collect():
+            async with AsyncWeatherClient(self.base_url, concurrency=3) as client:
+                return [item async for item in client.get_many(f'city{i}' for i in range(12))]
+
+        results = asyncio.run(collect())
+
+        self.assertEqual(sorted(city for city, _ in results), sorted(f'city{i}' for i in range(12)))
+        self.assertLessEqual(FakeWeatherHandler.max_in_flight, 3)
+
+    def test_failed_city_does_not_end_the_stream(self):
+        async def collect():
+            async with AsyncWeatherClient(self.base_url, concurrency=2) as client:
+                return dict([item async for item in client.get_many(['tehran', 'loop', 'london'])])
+
+        results = asyncio.run(collect())
+
+        self.assertEqual(results['tehran']['status'], 200)
+        self.assertEqual(results['london']['status'], 200)
+        self.assertIn('TooManyRedirects', results['loop']['error'])
+
+    def test_batch_writes_json_lines(self):
+        source = io.StringIO("tehran\n\nlondon\nloop\n")
+        output = io.StringIO()
+        asyncio.run(stream_weather(source, output, concurrency=2, base_url=self.base_url))
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(sorted(line['city'] for line in lines), ['london', 'loop', 'tehran'])
+        self.assertEqual({line['city']: line['status'] for line in lines},
+                         {'tehran': 200, 'london': 200, 'loop': 500})
+
+
+if __name__ == "__main__":
+    unittest.main()
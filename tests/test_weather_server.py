@@ -0,0 +1,218 @@
+import unittest
+from unittest import mock
+import datetime
+import http.client
+import io
+import json
+import threading
+import sys
+import os
+from http.server import ThreadingHTTPServer
+import requests
+# inserts the weather_project dir to path so we can import it
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../weather_project')))
+import weather_server
+from weather_server import weatherHandler, cache_control
+from auth import issue_token
+from admission import AdmissionController
+
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self.history_ranges = []
+
+    def save_request_data(self, city_name, request_time):
+        self.requests.append(city_name)
+        return len(self.requests)
+
+    def save_coord_request_data(self, lat, lon, request_time):
+        self.requests.append((lat, lon))
+        return len(self.requests)
+
+    def save_response_data(self, request_id, response_data):
+        self.responses.append((request_id, response_data))
+
+    def save_observation(self, city_name, weather):
+        pass
+
+    def get_request_count(self):
+        return len(self.requests)
+
+    def get_city_history(self, city_name, start, end, step):
+        self.history_ranges.append((start, end))
+        return []
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.queries = []
+
+    def get(self, query, timeout=None):
+        self.queries.append(query)
+        if 'q=unreachable' in query:
+            raise requests.exceptions.ConnectionError
+        response = requests.Response()
+        response.raw = io.BytesIO()
+        if 'q=nowhere' in query:
+            response.status_code = 404
+            response._content = b'{"cod": "404"}'
+            return response
+        response.status_code = 200
+        response._content = json.dumps({'main': {'temp': 293.15, 'feels_like': 292.15},
+                                        'dt': int(datetime.datetime.now().timestamp())}).encode()
+        return response
+
+
+class TestWeatherServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('localhost', 0), weatherHandler)
+        cls.url = f'http://localhost:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.upstream = FakeUpstream()
+        patches = [mock.patch.object(weather_server, 'get_db', return_value=self.db),
+                   mock.patch.object(weather_server, 'get_upstream', return_value=self.upstream),
+                   mock.patch.object(weather_server, 'get_city_stats'),
+                   mock.patch.object(weather_server, 'get_logger')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_city_weather(self):
+        response = requests.get(f'{self.url}/weather/tehran')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['temp'], 20.0)
+        self.assertEqual(response.json()['units'], 'metric')
+        self.assertTrue(response.headers['Cache-Control'].startswith('max-age='))
+        self.assertEqual(self.db.requests, ['tehran'])
+
+    def test_coord_weather(self):
+        response = requests.get(f'{self.url}/weather?lat=35.7&lon=51.4')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.db.requests, [(35.7, 51.4)])
+        self.assertEqual(requests.get(f'{self.url}/weather?lat=91&lon=0').status_code, 400)
+
+    def test_not_modified(self):
+        etag = requests.get(f'{self.url}/weather/tehran').headers['ETag']
+        response = requests.get(f'{self.url}/weather/tehran', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_units_change_etag(self):
+        metric = requests.get(f'{self.url}/weather/tehran')
+        imperial = requests.get(f'{self.url}/weather/tehran?units=imperial')
+
+        self.assertNotEqual(metric.headers['ETag'], imperial.headers['ETag'])
+        self.assertEqual(requests.get(f'{self.url}/weather/tehran?units=rankine').status_code, 400)
+
+    def test_upstream_error_is_not_cached(self):
+        response = requests.get(f'{self.url}/weather/nowhere')
+
+        self.assertEqual(response.json(), {'status': 404})
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+
+    def test_unreachable_upstream(self):
+        response = requests.get(f'{self.url}/weather/unreachable')
+
+        self.assertEqual(response.json(), {'status': 503})
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+
+    def test_history_from_utc(self):
+        response = requests.get(f'{self.url}/weather/tehran/history?from=2026-10-01T00:00:00Z')
+
+        self.assertEqual(response.status_code, 200)
+        start, end = self.db.history_ranges[0]
+        # compared with naive local observation times
+        utc = datetime.datetime(2026, 10, 1, tzinfo=datetime.timezone.utc)
+        self.assertEqual(start, utc.astimezone().replace(tzinfo=None))
+
+    def test_history_mixed_offsets(self):
+        response = requests.get(f'{self.url}/weather/tehran/history',
+                                params={'from': '2026-10-01T00:00:00+03:30', 'to': '2026-10-02T00:00:00'})
+
+        self.assertEqual(response.status_code, 200)
+        start, end = self.db.history_ranges[0]
+        tehran = datetime.datetime.fromisoformat('2026-10-01T00:00:00+03:30')
+        self.assertEqual(start, tehran.astimezone().replace(tzinfo=None))
+        self.assertEqual(end, datetime.datetime(2026, 10, 2))
+
+    def test_not_found(self):
+        response = requests.get(f'{self.url}/nothing')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Not Found'})
+
+    def test_admin_requires_token(self):
+        self.assertEqual(requests.get(f'{self.url}/admin/request_count').status_code, 401)
+
+        headers = {'Authorization': f'Bearer {issue_token("admin")}'}
+        response = requests.get(f'{self.url}/admin/request_count', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'count': 0})
+
+    def test_load_is_not_admitted(self):
+        admission = {'weather': AdmissionController(1, 0), 'admin': AdmissionController(1, 0)}
+        # the admin class is full and has no queue
+        admission['admin'].active = 1
+        headers = {'Authorization': f'Bearer {issue_token("admin")}'}
+        with mock.patch.object(weather_server, 'get_admission', return_value=admission):
+            shed = requests.get(f'{self.url}/admin/request_count', headers=headers)
+            load = requests.get(f'{self.url}/admin/load', headers=headers)
+
+        self.assertEqual(shed.status_code, 503)
+        self.assertIn('Retry-After', shed.headers)
+        self.assertEqual(load.status_code, 200)
+        self.assertEqual(load.json()['admin']['shed'], 1)
+
+    def test_malformed_signin(self):
+        response = requests.post(f'{self.url}/admin/signin', data=b'{not json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_bad_content_length(self):
+        connection = http.client.HTTPConnection('localhost', self.server.server_address[1])
+        connection.putrequest('POST', '/admin/signin')
+        connection.putheader('Content-Length', 'abc')
+        connection.endheaders()
+
+        self.assertEqual(connection.getresponse().status, 400)
+        connection.close()
+
+    def test_non_ascii_token(self):
+        response = requests.get(f'{self.url}/admin/request_count', headers={'Authorization': 'Bearer YWRtaW46MQ.\u00e9'})
+
+        self.assertEqual(response.status_code, 401)
+
+
+class TestCacheControl(unittest.TestCase):
+    def test_error_is_not_stored(self):
+        self.assertEqual(cache_control({'status': 404}), 'no-store')
+
+    def test_fresh_until_next_refresh(self):
+        last_update = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        max_age = int(cache_control({'status': 200, 'last_update': last_update})[len('max-age='):])
+
+        self.assertGreater(max_age, 0)
+        self.assertLessEqual(max_age, weather_server.C.WEATHER_REFRESH_INTERVAL)
+
+    def test_stale_observation(self):
+        self.assertEqual(cache_control({'status': 200, 'last_update': '2000-01-01 00:00:00'}), 'max-age=0')
+
+
+if __name__ == "__main__":
+    unittest.main()
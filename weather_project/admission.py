@@ -0,0 +1,87 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import config as C
+
+
+class Shed(Exception):
+    """
+    Raised when a request is turned away instead of being queued.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit for one class of routes.
+
+    Up to `limit` requests run at once and up to `max_queue` more wait for a
+    slot. A request is shed straight away when the queue is full or when the
+    expected wait, estimated from the average service time, would take it
+    past its deadline.
+    """
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.shed = 0
+        self.service_time = C.ADMISSION_INITIAL_SERVICE_TIME
+        self.condition = threading.Condition()
+
+    def expected_wait(self) -> float:
+        # everyone queued ahead of us plus ourselves, served `limit` at a time
+        return (self.queued + 1) * self.service_time / self.limit
+
+    def _shed(self) -> Shed:
+        self.shed += 1
+        return Shed(max(1, math.ceil(self.expected_wait())))
+
+    @contextmanager
+    def admit(self, deadline: float):
+        """
+        Run the body once a slot is free.
+
+        Args:
+        - deadline (float): time.monotonic() by which the request must be answered.
+
+        Raises:
+        - Shed: if the request can not start in time.
+        """
+
+        with self.condition:
+            if self.active >= self.limit:
+                if self.queued >= self.max_queue or time.monotonic() + self.expected_wait() > deadline:
+                    raise self._shed()
+                self.queued += 1
+                try:
+                    while self.active >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._shed()
+                        self.condition.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.active += 1
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self.condition:
+                self.active -= 1
+                self.service_time += C.ADMISSION_SMOOTHING * (elapsed - self.service_time)
+                self.condition.notify()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {'active': self.active, 'queued': self.queued, 'limit': self.limit,
+                    'max_queue': self.max_queue, 'shed': self.shed,
+                    'service_time': round(self.service_time, 4)}
@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import config as C
+
+
+# without a configured secret, tokens are only valid in this process
+SECRET: bytes = (C.ADMIN_SECRET or secrets.token_hex(32)).encode()
+
+
+def _sign(payload: bytes) -> str:
+    digest = hmac.new(SECRET, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def issue_token(username: str, ttl: int=C.ADMIN_SESSION_TTL) -> str:
+    """
+    Create a signed session token for an authenticated admin.
+
+    Args:
+    - username (str): The admin the token is issued to.
+    - ttl (int): Seconds until the token expires.
+
+    Returns:
+    - str: The token, to be sent back as 'Authorization: Bearer <token>'.
+    """
+
+    payload = f'{username}:{int(time.time()) + ttl}'.encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=') + '.' + _sign(payload)
+
+
+def verify_token(token: str) -> Optional[str]:
+    """
+    Check a session token's signature and expiry, without touching the database.
+
+    Returns:
+    - Optional[str]: The admin username, or None if the token is invalid or expired.
+    """
+
+    try:
+        encoded, signature = token.split('.')
+        payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    except (ValueError, TypeError):
+        return None
+    # bytes, since compare_digest rejects non-ASCII str
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+
+    try:
+        username, _, expires = payload.decode().rpartition(':')
+    except UnicodeDecodeError:
+        return None
+    if not expires.isdigit() or int(expires) < time.time():
+        return None
+    return username
+
+
+def _hash(password: str, salt: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, C.ADMIN_HASH_ITERATIONS)
+
+
+class PasswordCache:
+    """
+    Salted hashes of admin passwords, loaded from the database on first use
+    and kept for `ttl` seconds so that repeated logins skip the lookup.
+    Unknown usernames are cached as well, so repeated attempts with one
+    username cost a single lookup. At most `max_entries` usernames are kept,
+    least recently used first out.
+    """
+
+    def __init__(self, fetch: Callable[[str], Optional[str]], ttl: int=C.ADMIN_PASS_CACHE_TTL,
+                 max_entries: int=C.ADMIN_PASS_CACHE_SIZE):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # compared against for unknown users, so they take as long as known ones
+        self.dummy = _hash(secrets.token_hex(16), os.urandom(16))
+
+    def _entry(self, username: str):
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry:
+                self.entries.move_to_end(username)
+        if entry and entry[2] > time.monotonic():
+            return entry
+
+        password = self.fetch(username)
+        salt = os.urandom(16)
+        entry = (salt, _hash(password, salt) if password is not None else None, time.monotonic() + self.ttl)
+        with self.lock:
+            self.entries[username] = entry
+            self.entries.move_to_end(username)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def check(self, username: str, password: str) -> bool:
+        salt, expected, _ = self._entry(username)
+        matches = hmac.compare_digest(_hash(password, salt), expected or self.dummy)
+        return matches and expected is not None
+
+    def invalidate(self, username: str=None) -> None:
+        with self.lock:
+            if username is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(username, None)
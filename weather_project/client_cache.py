@@ -0,0 +1,127 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import config as C
+
+
+class CacheEntry:
+    def __init__(self, data: dict, etag: str=None, expires: float=0):
+        self.data = data
+        self.etag = etag
+        self.expires = expires
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires
+
+    def to_dict(self) -> dict:
+        return {'data': self.data, 'etag': self.etag, 'expires': self.expires}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CacheEntry':
+        return cls(data['data'], data.get('etag'), data.get('expires', 0))
+
+
+def freshness(headers, data: dict) -> Optional[float]:
+    """
+    Work out until when a response may be served without asking the server.
+
+    Args:
+    - headers: The response headers.
+    - data (dict): The decoded response body.
+
+    Returns:
+    - Optional[float]: Expiry as a unix timestamp, or None if the response must not be stored.
+    """
+
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return 0
+    if match := re.search(r'max-age=(\d+)', cache_control):
+        return time.time() + int(match.group(1))
+
+    # server sent no freshness info, fall back to the observation time
+    if data.get('status') != 200 or 'last_update' not in data:
+        return None
+    try:
+        last_update = datetime.datetime.strptime(data['last_update'], '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+    return last_update.timestamp() + C.WEATHER_REFRESH_INTERVAL
+
+
+class ResponseCache:
+    """
+    Client side cache of weather responses keyed by city.
+
+    Keeps up to `max_entries` entries in memory, evicting the least recently
+    used. If `cache_dir` is given, entries are also written there as JSON
+    files, so they survive between client runs.
+    """
+
+    def __init__(self, max_entries: int=C.CLIENT_CACHE_SIZE, cache_dir: str=C.CLIENT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(city: str) -> str:
+        return city.strip().lower()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, city: str) -> Optional[CacheEntry]:
+        key = self.key(city)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if not self.cache_dir:
+            return None
+
+        try:
+            with open(self._path(key)) as f:
+                entry = CacheEntry.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def set(self, city: str, entry: CacheEntry) -> None:
+        key = self.key(city)
+        self._remember(key, entry)
+        if self.cache_dir:
+            tmp_path = self._path(key) + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(entry.to_dict(), f)
+            os.replace(tmp_path, self._path(key))
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, city: str) -> None:
+        key = self.key(city)
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.cache_dir:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
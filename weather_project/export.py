@@ -0,0 +1,89 @@
+import argparse
+import datetime
+import gzip
+import sys
+
+import config as C
+
+
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+class ChunkedWriter:
+    """
+    File-like object that buffers writes and hands them to `sink` in blocks
+    of `chunk_size` bytes, so a stream of small rows becomes a few large writes.
+    """
+
+    def __init__(self, sink, chunk_size: int=C.EXPORT_CHUNK_SIZE):
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self.sink.write(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.sink.write(bytes(self.buffer))
+            self.buffer.clear()
+        self.sink.flush()
+
+
+def export(db, sink, start: datetime.datetime, end: datetime.datetime, fmt: str='csv', compress: bool=False) -> None:
+    """
+    Export request/response logs to sink in fixed-size chunks.
+
+    Args:
+    - db (WeatherDatabase): A connected database.
+    - sink: A binary file-like object to write to.
+    - start (datetime): Start of the range.
+    - end (datetime): End of the range.
+    - fmt (str): 'csv' or 'jsonl'.
+    - compress (bool): gzip the output.
+
+    Returns:
+    - None
+    """
+
+    writer = ChunkedWriter(sink)
+    if compress:
+        with gzip.GzipFile(fileobj=writer, mode='wb') as output:
+            db.export_requests(output, start, end, fmt)
+    else:
+        db.export_requests(writer, start, end, fmt)
+    writer.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export request/response logs")
+    parser.add_argument('--from', dest='start', type=datetime.datetime.fromisoformat,
+                        default=datetime.datetime.min, help="ISO start time (inclusive)")
+    parser.add_argument('--to', dest='end', type=datetime.datetime.fromisoformat,
+                        default=datetime.datetime.max, help="ISO end time (exclusive)")
+    parser.add_argument('--format', choices=sorted(CONTENT_TYPES), default='csv')
+    parser.add_argument('--gzip', action='store_true', help="compress the output")
+    parser.add_argument('--output', default='-', help="output file, '-' for stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from weather_database import WeatherDatabase
+
+    args = parse_args()
+    db = WeatherDatabase()
+    db.connect_database()
+    try:
+        if args.output == '-':
+            export(db, sys.stdout.buffer, args.start, args.end, args.format, args.gzip)
+        else:
+            with open(args.output, 'wb') as sink:
+                export(db, sink, args.start, args.end, args.format, args.gzip)
+    finally:
+        db.close_conn()
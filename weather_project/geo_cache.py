@@ -0,0 +1,93 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+import config as C
+
+
+class GeoGridCache:
+    """
+    Cache of weather responses for coordinates, snapped to a grid of
+    `resolution` degree cells. Everyone inside a cell shares one entry and,
+    while it is being fetched, one upstream request.
+
+    Cells are indexed by a single integer (row * columns + column), and the
+    least recently used cells are evicted beyond `max_cells`.
+    """
+
+    def __init__(self, resolution: float=C.GEO_GRID_RESOLUTION, max_cells: int=C.GEO_CACHE_SIZE,
+                 ttl: int=C.WEATHER_REFRESH_INTERVAL):
+        self.resolution = resolution
+        self.max_cells = max_cells
+        self.ttl = ttl
+        self.rows = math.ceil(180 / resolution) + 1
+        self.columns = math.ceil(360 / resolution) + 1
+        self.entries: 'OrderedDict[int, Tuple[float, dict]]' = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def cell(self, lat: float, lon: float) -> int:
+        row = math.floor((lat + 90) / self.resolution)
+        column = math.floor((lon + 180) / self.resolution)
+        return row * self.columns + column
+
+    def center(self, cell: int) -> Tuple[float, float]:
+        row, column = divmod(cell, self.columns)
+        # the last row and column hold lat=90 and lon=180, their centers would be past the edge
+        lat = min((row + 0.5) * self.resolution - 90, 90)
+        lon = min((column + 0.5) * self.resolution - 180, 180)
+        return round(lat, 6), round(lon, 6)
+
+    def get(self, lat: float, lon: float, fetch: Callable[[float, float], dict], timeout: float=None) -> dict:
+        """
+        Return the weather for the cell containing (lat, lon).
+
+        Args:
+        - lat (float): Latitude.
+        - lon (float): Longitude.
+        - fetch (Callable): Called with the cell center on a miss.
+        - timeout (float): Seconds to wait for a fetch already in flight for the cell.
+
+        Returns:
+        - dict: The cached or freshly fetched weather, or {'status': 504} if the wait timed out.
+        """
+
+        cell = self.cell(lat, lon)
+        with self.lock:
+            entry = self.entries.get(cell)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(cell)
+                return entry[1]
+
+            waiter = self.in_flight.get(cell)
+            if waiter is None:
+                waiter = self.in_flight[cell] = [threading.Event(), None]
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            if not waiter[0].wait(timeout):
+                return {'status': 504}
+            return waiter[1]
+
+        # waiters get this if fetch raises
+        weather = {'status': 500}
+        try:
+            weather = fetch(*self.center(cell))
+        finally:
+            waiter[1] = weather
+            with self.lock:
+                del self.in_flight[cell]
+                if weather.get('status') == 200:
+                    self.entries[cell] = (time.monotonic() + self.ttl, weather)
+                    self.entries.move_to_end(cell)
+                    while len(self.entries) > self.max_cells:
+                        self.entries.popitem(last=False)
+            waiter[0].set()
+        return weather
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,24 @@
+import functools
+import os
+import threading
+
+
+def per_process(factory):
+    """
+    Decorator for resource factories. The resource is created on the first
+    call, then reused for the rest of the process. A forked child gets its
+    own instance instead of sharing the parent's sockets and files.
+    """
+    instances = {}
+    lock = threading.Lock()
+
+    @functools.wraps(factory)
+    def wrapper():
+        pid = os.getpid()
+        if pid not in instances:
+            with lock:
+                if pid not in instances:
+                    instances.clear()
+                    instances[pid] = factory()
+        return instances[pid]
+    return wrapper
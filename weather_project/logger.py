@@ -1,5 +1,6 @@
 import logging
 import config as C
+from lazy import per_process
 
 
 class Logger:
@@ -7,9 +8,13 @@ class Logger:
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(log_level)
         formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        # a forked worker builds its own Logger around the same logging.Logger,
+        # which already has the parent's handler
+        if not self.logger.handlers:
+            # the log file is only opened once something is logged
+            file_handler = logging.FileHandler(log_file, delay=True)
+            file_handler.setFormatter(formatter)
+            self.logger.addHandler(file_handler)
 
     def info(self, message):
         self.logger.info(message)
@@ -18,4 +23,9 @@ class Logger:
         self.logger.warning(message)
 
     def error(self, message):
-        self.logger.error(message, exc_info=True)
\ No newline at end of file
+        self.logger.error(message, exc_info=True)
+
+
+@per_process
+def get_logger() -> Logger:
+    return Logger()
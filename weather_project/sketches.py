@@ -0,0 +1,354 @@
+import base64
+import fcntl
+import hashlib
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Tuple
+
+import config as C
+
+
+def _hash64(value: str) -> int:
+    digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog:
+    """
+    Fixed size distinct counter. Uses 2**precision one-byte registers, so
+    memory does not grow with the number of distinct values added.
+    """
+
+    def __init__(self, precision: int=12):
+        assert 4 <= precision <= 16
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        x = _hash64(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is far more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        assert self.precision == other.precision, "Can not merge sketches of different precision"
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def to_dict(self) -> dict:
+        return {'precision': self.precision,
+                'registers': base64.b64encode(bytes(self.registers)).decode()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HyperLogLog':
+        hll = cls(data['precision'])
+        hll.registers = bytearray(base64.b64decode(data['registers']))
+        return hll
+
+
+class CountMinSketch:
+    """
+    Approximate frequency table of `depth` rows by `width` counters.
+    Estimates never undercount; overcounting is bounded by the table width.
+    """
+
+    def __init__(self, width: int=2048, depth: int=4):
+        self.width = width
+        self.depth = depth
+        self.table = [array('Q', bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, value: str):
+        x = _hash64(value)
+        h1, h2 = x >> 32, (x & 0xFFFFFFFF) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, value: str, count: int=1) -> int:
+        """
+        Add `count` occurrences of value and return its new estimate.
+        """
+        estimate = None
+        for row, i in zip(self.table, self._indexes(value)):
+            row[i] += count
+            estimate = row[i] if estimate is None else min(estimate, row[i])
+        return estimate
+
+    def estimate(self, value: str) -> int:
+        return min(row[i] for row, i in zip(self.table, self._indexes(value)))
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        assert (self.width, self.depth) == (other.width, other.depth), "Can not merge sketches of different shape"
+        for row, other_row in zip(self.table, other.table):
+            for i, value in enumerate(other_row):
+                if value:
+                    row[i] += value
+
+    def to_dict(self) -> dict:
+        return {'width': self.width, 'depth': self.depth,
+                'table': [base64.b64encode(row.tobytes()).decode() for row in self.table]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CountMinSketch':
+        cms = cls(data['width'], data['depth'])
+        for row, encoded in zip(cms.table, data['table']):
+            row[:] = array('Q', base64.b64decode(encoded))
+        return cms
+
+
+class TopK:
+    """
+    Heavy hitters tracker built on a CountMinSketch and a min-heap of the
+    current top `k` candidates.
+    """
+
+    def __init__(self, k: int=10, width: int=2048, depth: int=4):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates: Dict[str, int] = {}
+        self.heap: List[Tuple[int, str]] = []
+
+    def add(self, value: str) -> None:
+        estimate = self.sketch.add(value)
+        if value in self.candidates or len(self.candidates) < self.k:
+            self._push(value, estimate)
+            return
+
+        min_count, min_value = self._peek_min()
+        if estimate > min_count:
+            del self.candidates[min_value]
+            heapq.heappop(self.heap)
+            self._push(value, estimate)
+
+    def _push(self, value: str, estimate: int) -> None:
+        self.candidates[value] = estimate
+        heapq.heappush(self.heap, (estimate, value))
+        if len(self.heap) > 4 * self.k:
+            # drop stale entries so the heap stays proportional to k
+            self.heap = [(c, v) for v, c in self.candidates.items()]
+            heapq.heapify(self.heap)
+
+    def _peek_min(self) -> Tuple[int, str]:
+        # entries are invalidated lazily when a candidate's count changes
+        while self.candidates.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0]
+
+    def top(self) -> List[Tuple[str, int]]:
+        return sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)
+
+    def merge(self, other: 'TopK') -> None:
+        self.sketch.merge(other.sketch)
+        names = set(self.candidates) | set(other.candidates)
+        ranked = sorted(((self.sketch.estimate(v), v) for v in names), reverse=True)[:self.k]
+        self.candidates = {v: c for c, v in ranked}
+        self.heap = [(c, v) for c, v in ranked]
+        heapq.heapify(self.heap)
+
+    def to_dict(self) -> dict:
+        return {'k': self.k, 'sketch': self.sketch.to_dict(), 'candidates': self.candidates}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'TopK':
+        topk = cls(data['k'])
+        topk.sketch = CountMinSketch.from_dict(data['sketch'])
+        topk.candidates = dict(data['candidates'])
+        topk.heap = [(c, v) for v, c in topk.candidates.items()]
+        heapq.heapify(topk.heap)
+        return topk
+
+
+BASE_CHECKPOINT = 'sketch-base.json'
+
+
+def _checkpoint_pid(name: str):
+    """
+    Returns the pid of a per-process checkpoint file name, or None for other files.
+    """
+    if not (name.startswith('sketch-') and name.endswith('.json')):
+        return None
+    try:
+        return int(name[len('sketch-'):-len('.json')])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class CityStats:
+    """
+    In-memory city analytics for one server process.
+
+    Each process periodically checkpoints its sketches to its own file in
+    `checkpoint_dir`; queries merge every checkpoint found there so that
+    the numbers cover all worker processes. Checkpoints of processes that
+    have exited are folded into one base checkpoint, so the directory holds
+    one file per live worker plus the base, and the merged checkpoints are
+    re-read at most once per `interval`.
+    """
+
+    def __init__(self, checkpoint_dir: str=C.SKETCH_DIR, interval: int=C.SKETCH_CHECKPOINT_INTERVAL, k: int=C.SKETCH_TOP_K):
+        self.checkpoint_dir = checkpoint_dir
+        self.interval = interval
+        self.distinct = HyperLogLog()
+        self.top = TopK(k)
+        self.lock = threading.Lock()
+        self.last_checkpoint = time.monotonic()
+        self.others = None
+        self.others_loaded_at = 0.0
+        self.load()
+        self.compact()
+
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(self.checkpoint_dir, f'sketch-{os.getpid()}.json')
+
+    def record(self, city: str) -> None:
+        city = city.lower()
+        with self.lock:
+            self.distinct.add(city)
+            self.top.add(city)
+            due = time.monotonic() - self.last_checkpoint >= self.interval
+        if due:
+            self.checkpoint()
+
+    def to_dict(self) -> dict:
+        return {'distinct': self.distinct.to_dict(), 'top': self.top.to_dict()}
+
+    def checkpoint(self) -> None:
+        with self.lock:
+            data = json.dumps(self.to_dict())
+            self.last_checkpoint = time.monotonic()
+        self._write(os.path.basename(self.checkpoint_path), data)
+        self.compact()
+
+    def _write(self, name: str, data: str) -> None:
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = os.path.join(self.checkpoint_dir, name)
+        with open(path + '.tmp', 'w') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def _read(self, name: str):
+        """
+        Returns the (HyperLogLog, TopK) stored in a checkpoint file, or None if it can not be read.
+        """
+        try:
+            with open(os.path.join(self.checkpoint_dir, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return HyperLogLog.from_dict(data['distinct']), TopK.from_dict(data['top'])
+
+    def load(self) -> None:
+        """
+        Restore this process's sketches from a checkpoint left by a previous run.
+        """
+        data = self._read(os.path.basename(self.checkpoint_path))
+        if data is not None:
+            self.distinct, self.top = data
+
+    def compact(self) -> None:
+        """
+        Fold the checkpoints of processes that are no longer running into the
+        base checkpoint and delete them.
+        """
+        try:
+            names = os.listdir(self.checkpoint_dir)
+        except OSError:
+            return
+        stale = [name for name in names
+                 if _checkpoint_pid(name) is not None and not _pid_alive(_checkpoint_pid(name))]
+        if not stale:
+            return
+
+        # several workers may compact at once, the lock makes each stale file count exactly once
+        with open(os.path.join(self.checkpoint_dir, 'compact.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            distinct, top = self._read(BASE_CHECKPOINT) or (HyperLogLog(), TopK(self.top.k))
+            compacted = []
+            for name in stale:
+                data = self._read(name)
+                if data is None:
+                    # already compacted by another worker
+                    continue
+                distinct.merge(data[0])
+                top.merge(data[1])
+                compacted.append(name)
+            if compacted:
+                self._write(BASE_CHECKPOINT, json.dumps({'distinct': distinct.to_dict(), 'top': top.to_dict()}))
+            for name in compacted:
+                os.remove(os.path.join(self.checkpoint_dir, name))
+
+    def _other_processes(self) -> Tuple[HyperLogLog, TopK]:
+        """
+        The merged checkpoints of every other process, re-read at most once per interval.
+        """
+        now = time.monotonic()
+        if self.others is not None and now - self.others_loaded_at < self.interval:
+            return self.others
+
+        distinct, top = HyperLogLog(), TopK(self.top.k)
+        try:
+            names = os.listdir(self.checkpoint_dir)
+        except OSError:
+            names = []
+        own = os.path.basename(self.checkpoint_path)
+        for name in names:
+            if name == own or not (name == BASE_CHECKPOINT or _checkpoint_pid(name) is not None):
+                continue
+            data = self._read(name)
+            if data is not None:
+                distinct.merge(data[0])
+                top.merge(data[1])
+        self.others = distinct, top
+        self.others_loaded_at = now
+        return self.others
+
+    def _merged(self) -> Tuple[HyperLogLog, TopK]:
+        with self.lock:
+            distinct = HyperLogLog.from_dict(self.distinct.to_dict())
+            top = TopK.from_dict(self.top.to_dict())
+        other_distinct, other_top = self._other_processes()
+        distinct.merge(other_distinct)
+        top.merge(other_top)
+        return distinct, top
+
+    def distinct_cities(self) -> int:
+        """
+        Returns:
+        - int: Estimated number of distinct cities requested successfully.
+        """
+        return self._merged()[0].count()
+
+    def top_cities(self) -> List[Tuple[str, int]]:
+        """
+        Returns:
+        - List[Tuple[str, int]]: The most requested cities and their estimated counts.
+        """
+        return self._merged()[1].top()
@@ -0,0 +1,141 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Callable, List, Optional
+
+import config as C
+from logger import get_logger
+
+
+_local = threading.local()
+_disabled = nullcontext()
+
+
+class Trace:
+    """
+    Timings of the phases (spans) of one request.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.total = 0.0
+        self.spans = []
+
+    def to_dict(self) -> dict:
+        spans = {name: round(seconds * 1000, 2) for name, seconds in self.spans}
+        spans['other'] = round((self.total - sum(seconds for _, seconds in self.spans)) * 1000, 2)
+        return {'request': self.name, 'total_ms': round(self.total * 1000, 2), 'spans_ms': spans}
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.trace.spans.append((self.name, time.perf_counter() - self.start))
+
+
+def span(name: str):
+    """
+    Context manager timing one phase of the current request.
+    Outside a traced request it is a shared no-op.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return _disabled
+    return _Span(trace, name)
+
+
+class Profiler:
+    """
+    cProfile the next `n` requests, one at a time, and aggregate the results.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining = 0
+        self.busy = False
+        self.profiled = 0
+        self.stats = None
+
+    def arm(self, n: int) -> None:
+        with self.lock:
+            self.remaining = n
+            self.profiled = 0
+            self.stats = None
+
+    def claim(self) -> Optional[cProfile.Profile]:
+        if not self.remaining:
+            return None
+        with self.lock:
+            if self.remaining <= 0 or self.busy:
+                return None
+            self.remaining -= 1
+            self.busy = True
+        return cProfile.Profile()
+
+    def collect(self, profile: cProfile.Profile) -> None:
+        with self.lock:
+            self.busy = False
+            self.profiled += 1
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    def report(self, lines: int=C.PROFILE_REPORT_LINES) -> dict:
+        with self.lock:
+            if self.stats is None:
+                return {'profiled': 0, 'remaining': self.remaining, 'report': ''}
+            stream = io.StringIO()
+            self.stats.stream = stream
+            self.stats.sort_stats('cumulative').print_stats(lines)
+            return {'profiled': self.profiled, 'remaining': self.remaining, 'report': stream.getvalue()}
+
+
+profiler = Profiler()
+slow_requests = deque(maxlen=C.SLOW_LOG_SIZE)
+
+
+def handle(name: str, func: Callable) -> None:
+    """
+    Run a request handler, tracing its spans when C.TRACING is on and
+    profiling it when the profiler is armed. Requests slower than
+    C.SLOW_REQUEST_THRESHOLD seconds are logged with their span breakdown.
+    """
+
+    profile = profiler.claim()
+    if not C.TRACING and profile is None:
+        func()
+        return
+
+    trace = _local.trace = Trace(name)
+    try:
+        if profile is None:
+            func()
+        else:
+            profile.runcall(func)
+    finally:
+        _local.trace = None
+        trace.total = time.perf_counter() - trace.start
+        if profile is not None:
+            profiler.collect(profile)
+        if trace.total >= C.SLOW_REQUEST_THRESHOLD:
+            data = trace.to_dict()
+            slow_requests.append(data)
+            get_logger().warning(f"slow request: {data}")
+
+
+def get_slow_requests() -> List[dict]:
+    return list(slow_requests)
@@ -0,0 +1,42 @@
+from typing import List, Sequence
+
+import config as C
+
+
+# scale and offset from kelvin: value = kelvin * scale + offset
+CONVERSIONS = {
+    'standard': (1.0, 0.0),
+    'metric': (1.0, -273.15),
+    'imperial': (9 / 5, -459.67),
+}
+
+TEMPERATURE_FIELDS = ('temp', 'feels_like_temp')
+
+
+def convert_many(kelvins: Sequence[float], units: str) -> List[float]:
+    """
+    Convert a column of kelvin temperatures in one pass.
+
+    Args:
+    - kelvins (Sequence[float]): Temperatures in kelvin.
+    - units (str): 'metric', 'imperial' or 'standard'.
+
+    Returns:
+    - List[float]: The temperatures in the requested units, rounded to 2 decimals.
+    """
+
+    scale, offset = CONVERSIONS[units]
+    return [round(k * scale + offset, 2) for k in kelvins]
+
+
+def convert_weather(weather: dict, units: str=C.API_UNIT) -> dict:
+    """
+    Return a copy of a canonical (kelvin) weather response in the requested units.
+    """
+
+    if weather.get('status') != 200:
+        return weather
+    converted = dict(weather, units=units)
+    values = convert_many([weather[field] for field in TEMPERATURE_FIELDS], units)
+    converted.update(zip(TEMPERATURE_FIELDS, values))
+    return converted
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+import requests
+
+import config as C
+
+
+class LatencyHistogram:
+    """
+    Latencies of the last `size` upstream calls, in seconds.
+    """
+
+    def __init__(self, size: int=C.UPSTREAM_LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Returns the q-th percentile (0-100), or None until enough samples are in.
+        """
+        with self.lock:
+            if len(self.samples) < C.UPSTREAM_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class Upstream:
+    """
+    Client for the external weather API.
+
+    The timeout follows the observed p99 latency (clamped between
+    UPSTREAM_MIN_TIMEOUT and UPSTREAM_MAX_TIMEOUT). Requests start at the
+    providers in `urls` round-robin; one that can not be reached or answers
+    with a server error is retried on the next provider while the timeout
+    lasts. With hedging enabled, a request still running after the observed
+    p95 is sent again to the next provider and whichever answers first wins.
+    Every request earns `hedge_ratio` of a hedge, which caps hedges at that
+    share of traffic.
+    """
+
+    def __init__(self, urls: List[str]=C.UPSTREAM_URLS, hedge: bool=C.UPSTREAM_HEDGE,
+                 hedge_ratio: float=C.UPSTREAM_HEDGE_RATIO):
+        self.urls = urls
+        self.hedge = hedge
+        self.hedge_ratio = hedge_ratio
+        self.hedge_budget = 0.0
+        self.next_url = 0
+        self.latency = LatencyHistogram()
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=C.UPSTREAM_MAX_WORKERS)
+        self.lock = threading.Lock()
+
+    def timeout(self) -> float:
+        p99 = self.latency.percentile(99)
+        if p99 is None:
+            return C.UPSTREAM_MAX_TIMEOUT
+        return min(max(p99 * C.UPSTREAM_TIMEOUT_FACTOR, C.UPSTREAM_MIN_TIMEOUT), C.UPSTREAM_MAX_TIMEOUT)
+
+    def _pick_urls(self) -> List[str]:
+        """
+        The providers to try for one request, starting at the next one round-robin.
+        """
+        with self.lock:
+            start = self.next_url % len(self.urls)
+            self.next_url += 1
+        return self.urls[start:] + self.urls[:start]
+
+    def _take_hedge(self) -> bool:
+        with self.lock:
+            if self.hedge_budget < 1:
+                return False
+            self.hedge_budget -= 1
+        return True
+
+    def _call(self, url: str, query: str, timeout: float) -> requests.Response:
+        start = time.monotonic()
+        try:
+            response = self.session.get(f'{url}?{query}', timeout=timeout)
+        except requests.exceptions.Timeout:
+            # a lower bound, but it still pushes the timeout up
+            self.latency.record(time.monotonic() - start)
+            raise
+        self.latency.record(time.monotonic() - start)
+        return response
+
+    def _call_with_failover(self, urls: List[str], query: str, deadline: float) -> requests.Response:
+        """
+        Call urls in turn until one is reachable and answers without a
+        server error. The last provider's answer, or error, is returned
+        as is, and so is any once the deadline has passed.
+        """
+        for i, url in enumerate(urls):
+            last = i == len(urls) - 1
+            try:
+                response = self._call(url, query, deadline - time.monotonic())
+            except requests.exceptions.ConnectionError:
+                if last or time.monotonic() >= deadline:
+                    raise
+                continue
+            if response.status_code < 500 or last or time.monotonic() >= deadline:
+                return response
+            response.close()
+
+    def get(self, query: str, timeout: float=None) -> requests.Response:
+        """
+        Send query to the upstream providers.
+
+        Args:
+        - query (str): The url query string, without '?'.
+        - timeout (float): Upper bound for the timeout, e.g. the caller's remaining deadline.
+
+        Returns:
+        - requests.Response: The first response that is not a server error.
+        """
+
+        timeout = self.timeout() if timeout is None else min(self.timeout(), timeout)
+        deadline = time.monotonic() + timeout
+        hedge_delay = self.latency.percentile(95) if self.hedge else None
+        with self.lock:
+            self.hedge_budget = min(self.hedge_budget + self.hedge_ratio, C.UPSTREAM_MAX_HEDGE_BURST)
+
+        if hedge_delay is None or hedge_delay >= timeout:
+            return self._call_with_failover(self._pick_urls(), query, deadline)
+
+        pending = {self.executor.submit(self._call_with_failover, self._pick_urls(), query, deadline)}
+        done, _ = wait(pending, timeout=hedge_delay)
+        if not done and self._take_hedge():
+            pending.add(self.executor.submit(self._call_with_failover, self._pick_urls(), query, deadline))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as exc:
+                    error = exc
+                    continue
+                if response.status_code < 500 or not pending:
+                    for other in pending:
+                        other.add_done_callback(_close_response)
+                    return response
+                response.close()
+        raise error
+
+
+def _close_response(future) -> None:
+    if not future.exception():
+        future.result().close()
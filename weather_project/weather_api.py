@@ -0,0 +1,188 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, Tuple
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config as C
+from client_cache import CacheEntry, ResponseCache, freshness
+
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def error_record(exc: Exception) -> dict:
+    """
+    The result reported for a city whose request failed in a batch, so one
+    bad city does not end the whole batch.
+    """
+    return {'status': 500, 'error': f'{type(exc).__name__}: {exc}'}
+
+
+class WeatherClient:
+    """
+    Blocking client for the weather server.
+
+    Connections are kept in a pool and reused between calls. Failed calls
+    (connection errors, timeouts and retryable statuses) are retried with
+    exponential backoff and full jitter.
+
+    With a ResponseCache, fresh entries are returned without a request and
+    stale entries that carry an ETag are revalidated with a conditional
+    request; a 304 reply reuses the body we already have.
+    """
+
+    def __init__(self, base_url: str=C.WEATHER_URL, timeout: float=10, retries: int=3,
+                 backoff: float=0.2, pool_size: int=10, cache: ResponseCache=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = cache
+
+    def _sleep_time(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def get_weather(self, city: str) -> dict:
+        """
+        Gets data from the server for a given city
+
+        Args: city(str): Name of the city you want the data for
+
+        Returns: dict: a dictionary containing temp, feels like temp, last updated  Info for the city
+        """
+
+        entry = self.cache.get(city) if self.cache else None
+        if entry and entry.fresh:
+            return entry.data
+
+        url = f'{self.base_url}{quote(city)}'
+        headers = {'If-None-Match': entry.etag} if entry and entry.etag else {}
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+                if attempt == self.retries:
+                    return {'status': 503, 'error': str(exc)}
+                time.sleep(self._sleep_time(attempt))
+                continue
+
+            if response.status_code == 304 and entry:
+                self._store(city, response, entry.data)
+                return entry.data
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                time.sleep(self._sleep_time(attempt))
+                continue
+
+            try:
+                data = response.json()
+            except ValueError:
+                data = {'status': response.status_code}
+            self._store(city, response, data)
+            return data
+
+    def _store(self, city: str, response, data: dict) -> None:
+        if not self.cache:
+            return
+        expires = freshness(response.headers, data)
+        if expires is None:
+            self.cache.delete(city)
+        else:
+            self.cache.set(city, CacheEntry(data, response.headers.get('ETag'), expires))
+
+    def get_many(self, cities: Iterable[str], concurrency: int=10) -> Iterator[Tuple[str, dict]]:
+        """
+        Fetch several cities using up to `concurrency` threads.
+
+        Returns: Iterator[Tuple[str, dict]]: (city, weather) pairs in input order
+        """
+        cities = list(cities)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            yield from zip(cities, executor.map(self._get_or_error, cities))
+
+    def _get_or_error(self, city: str) -> dict:
+        try:
+            return self.get_weather(city)
+        except Exception as exc:
+            return error_record(exc)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs) -> None:
+        self.close()
+
+
+class AsyncWeatherClient:
+    """
+    asyncio front-end for WeatherClient.
+
+    At most `concurrency` requests are in flight at once; they share one
+    connection pool of the same size.
+    """
+
+    def __init__(self, base_url: str=C.WEATHER_URL, concurrency: int=10, **kwargs):
+        self.concurrency = concurrency
+        self.client = WeatherClient(base_url, pool_size=concurrency, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.semaphore = None
+
+    async def get_weather(self, city: str) -> dict:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.client.get_weather, city)
+
+    async def get_many(self, cities: Iterable[str]) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Fetch cities concurrently, yielding (city, weather) pairs as they complete.
+
+        Cities are read from the iterable lazily, so arbitrarily long inputs
+        only keep `concurrency` requests in memory.
+        """
+
+        async def fetch(city):
+            try:
+                return city, await self.get_weather(city)
+            except Exception as exc:
+                return city, error_record(exc)
+
+        pending = set()
+        try:
+            for city in cities:
+                pending.add(asyncio.ensure_future(fetch(city)))
+                if len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # the consumer stopped early or reading cities failed
+            for task in pending:
+                task.cancel()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args, **kwargs) -> None:
+        self.close()
@@ -1,13 +1,33 @@
 import requests
+import argparse
+import asyncio
 import json
 import sys
 import os
 import getpass
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../menu')))
-from models import generate_menu_from_dict
-from weather_server import logger
+from models import generate_menu_from_dict, run_menu
+from logger import get_logger
 import config as C
+from lazy import per_process
+from weather_api import WeatherClient, AsyncWeatherClient
+from client_cache import ResponseCache
+
+
+@per_process
+def get_client() -> WeatherClient:
+    return WeatherClient(cache=ResponseCache())
+
+
+admin_session = requests.Session()
+
+
+def admin_get(path: str) -> dict:
+    """
+    GET an admin endpoint using the session token from login_as_admin
+    """
+    return admin_session.get(f'{C.ADMIN_URL}{path}').json()
 
 
 def see_weather():
@@ -20,42 +40,48 @@ def see_weather():
         if response.get('status') == 200:
             print_weather(response)
             input("Press any key...")
-            return start_client()
+            return
         else:
             print("could not get data due to :", response["status"])
 
     
 def request_count():
-    url = f'{C.ADMIN_URL}request_count'
-    response = requests.get(url).json()
+    response = admin_get('request_count')
     print("Total count: ", response['count'])
 
 
 def success_request():
-    url = f'{C.ADMIN_URL}successful_request_count'
-    response = requests.get(url).json()
+    response = admin_get('successful_request_count')
     print("Total success count: ", response['count'])
 
 
 def last_hour_count():
-    url = f'{C.ADMIN_URL}last_hour_requests'
-    response = requests.get(url).json()
+    response = admin_get('last_hour_requests')
 
     for city, date in response['requests']:
         print(city, date)
 
 
 def city_count():
-    url = f'{C.ADMIN_URL}city_request_count'
-    response = requests.get(url).json()
+    response = admin_get('city_request_count')
     print(response)
     for city, count in response['requests']:
         print(count, ' requests for ', city)
 
 
+def distinct_city_count():
+    response = admin_get('distinct_cities')
+    print("Distinct cities (approx.): ", response['count'])
+
+
+def top_cities():
+    response = admin_get('top_cities')
+    for city, count in response['requests']:
+        print('~', count, ' requests for ', city)
+
+
 def admin_menu():
-    menu_obj = generate_menu_from_dict(admin_dict)
-    menu_obj()
+    run_menu(get_admin_menu())
     
 
 def login_as_admin():
@@ -64,11 +90,14 @@ def login_as_admin():
 
     data = {'username': username, 'password': password}
 
-    response = requests.post(f'{C.ADMIN_URL}signin', json=json.dumps(data))
+    response = admin_session.post(f'{C.ADMIN_URL}signin', json=data).json()
 
-    if response.json()['auth']:
-        logger.info("admin logged in")
+    if response.get('auth'):
+        admin_session.headers['Authorization'] = f"Bearer {response['token']}"
+        get_logger().info("admin logged in")
         admin_menu()
+    else:
+        print("Wrong username or password")
 
 
 def get_weather(city:str) -> dict:
@@ -80,9 +109,7 @@ def get_weather(city:str) -> dict:
     Returns: dict: a dictionary containing temp, feels like temp, last updated  Info for the city
     """
 
-    url = f'{C.WEATHER_URL}{city}'
-    response = requests.get(url).json()
-    return response
+    return get_client().get_weather(city)
 
 
 def print_weather(weather: dict) -> None:
@@ -120,6 +147,14 @@ admin_dict = {
         {
             'name': 'See last hour requests',
             'action': last_hour_count
+        },
+        {
+            'name': 'See distinct cities (approx.)',
+            'action': distinct_city_count
+        },
+        {
+            'name': 'See top cities (approx.)',
+            'action': top_cities
         }]}
 
 
@@ -138,16 +173,62 @@ main_menu_dict = {
 
 
 
-def start_client():
+# menu trees are built once and reused for the whole session
+
+@per_process
+def get_main_menu():
+    return generate_menu_from_dict(main_menu_dict)
+
+
+@per_process
+def get_admin_menu():
+    return generate_menu_from_dict(admin_dict)
+
+
+def start_client(inputs=None) -> None:
     """
     Start the weather client command-line interface.
+
+    Args: inputs: optional scripted answers for non-interactive use
     """
     
-    main_menu = generate_menu_from_dict(main_menu_dict)
-    main_menu()
-    
+    run_menu(get_main_menu(), inputs)
+
+
+async def stream_weather(source, output, concurrency: int=10, base_url: str=C.WEATHER_URL) -> None:
+    """
+    Fetch weather for every city name in source (one per line) and write
+    one JSON line per city to output as soon as its result is ready.
+    """
+
+    cities = (line.strip() for line in source if line.strip())
+    async with AsyncWeatherClient(base_url, concurrency=concurrency) as async_client:
+        async for city, weather in async_client.get_many(cities):
+            output.write(json.dumps({'city': city, **weather}) + '\n')
+            output.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Weather client")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="read city names from FILE ('-' for stdin) and print JSON Lines results")
+    parser.add_argument('--script', metavar='FILE',
+                        help="answer the interactive menus from FILE, one answer per line")
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help="maximum number of requests in flight in batch mode")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    start_client()
+    args = parse_args()
+    if args.script:
+        with open(args.script) as script:
+            start_client(line.rstrip('\n') for line in script)
+    elif args.batch is None:
+        start_client()
+    elif args.batch == '-':
+        asyncio.run(stream_weather(sys.stdin, sys.stdout, args.concurrency))
+    else:
+        with open(args.batch) as source:
+            asyncio.run(stream_weather(source, sys.stdout, args.concurrency))
     
\ No newline at end of file
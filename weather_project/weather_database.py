@@ -1,4 +1,8 @@
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import threading
+from contextlib import contextmanager
 from typing import List, Tuple
 import datetime as dt
 import json
@@ -13,33 +17,228 @@ def singleton(cls):
         return instances[cls]
     return wrapper
 
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """
+    A ThreadedConnectionPool whose getconn waits for a free connection
+    instead of raising PoolError once maxconn connections are checked out,
+    and which keeps returned connections open for reuse up to maxconn.
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self.slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        # minconn are opened up front; psycopg2 closes returned connections
+        # beyond minconn, which would mean a new connection per request
+        self.minconn = maxconn
+
+    def getconn(self, key=None):
+        self.slots.acquire()
+        try:
+            return super().getconn(key)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+
+# hot path inserts, prepared once per connection and run with EXECUTE
+PREPARED_STATEMENTS = {
+    'save_request': """PREPARE save_request (VARCHAR, TIMESTAMP) AS
+                       INSERT INTO request (city, dt) VALUES ($1, $2) RETURNING id""",
+    'save_coord_request': """PREPARE save_coord_request (DOUBLE PRECISION, DOUBLE PRECISION, TIMESTAMP) AS
+                            INSERT INTO request (lat, lon, dt) VALUES ($1, $2, $3) RETURNING id""",
+    'save_response': """PREPARE save_response (BIGINT, JSON) AS
+                        INSERT INTO response (request_id, data) VALUES ($1, $2)""",
+    'save_observation': """PREPARE save_observation (VARCHAR, TIMESTAMP, REAL, REAL) AS
+                           INSERT INTO observation (city, observed_at, temp, feels_like_temp)
+                           VALUES ($1, $2, $3, $4) ON CONFLICT DO NOTHING""",
+}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    A connection that remembers whether PREPARED_STATEMENTS have been prepared in its session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = False
+
+
+class ReplicaConnection(PooledConnection):
+    """
+    A replica connection, read-only and in autocommit from the moment it is opened.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_session(readonly=True, autocommit=True)
+
+
 @singleton
 class WeatherDatabase:
     def __init__(self):
         """
         Initialize a new WeatherDatabase instance.
         """
-        self.conn = None
+        self.pool = None
+        self.read_pool = None
+
+    def connect_database(self, database=C.DATABASE, user=C.USER, password=C.PASSWORD, host=C.HOST, port=C.PORT,
+                         replica_dsn=C.REPLICA_DSN, pool_size=C.DB_POOL_SIZE):
+        """
+        Open a pool of up to pool_size primary connections, used for writes,
+        and a pool of read-only autocommit replica_dsn connections for the
+        analytics queries. Replica connections are opened on demand, so the
+        replica may be down at start up; reads fall back to the primary
+        whenever it is unreachable.
+
+        Every method checks a connection out for the duration of one
+        transaction, so server threads never share a connection.
+        """
+        self.params = dict(database=database, user=user, password=password, host=host, port=port)
+        self.replica_dsn = replica_dsn
+        # not closed: the old pools may have been inherited from a parent process
+        self.pool = BlockingConnectionPool(1, pool_size, connection_factory=PooledConnection, **self.params)
+        self.read_pool = None
+        if replica_dsn:
+            self.read_pool = BlockingConnectionPool(0, pool_size, replica_dsn, connection_factory=ReplicaConnection)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check a connection out of the primary pool for one transaction. It is
+        committed when the block exits normally and rolled back if the block
+        raises, so a failed statement never leaves the connection in an
+        aborted transaction.
+        """
+        conn = self.pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                # broken connection, dropped from the pool below
+                conn.close()
+            raise
+        finally:
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    @contextmanager
+    def read_connection(self, pool=None):
+        """
+        Check a connection out of pool (the replica when there is one, else
+        the primary) for read-only queries. Replica connections are in
+        autocommit already, a primary one is switched to autocommit for this
+        checkout, so a plain SELECT never opens a transaction that has to be
+        committed.
+
+        A connection whose query raised is closed rather than returned, so
+        one left mid-COPY is never reused.
+        """
+        pool = pool or self.read_pool or self.pool
+        conn = pool.getconn()
+        primary = not conn.autocommit
+        try:
+            conn.autocommit = True
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        finally:
+            if primary and not conn.closed:
+                conn.autocommit = False
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def fetch(self, query: str, params=None, one: bool=False):
+        """
+        Run a read-only query, on the replica when there is one.
 
-    def connect_database(self, database=C.DATABASE, user=C.USER, password=C.PASSWORD, host=C.HOST, port=C.PORT):
-        self.conn = psycopg2.connect(database=database, user=user, password=password, host=host, port=port)
+        If the replica can not be reached or its connection drops, the query
+        is run again on the primary.
 
-    def create_tables(self):
+        Returns:
+        - The result rows, or only the first row (None if there is none) when one is True.
+        """
+
+        def run(pool):
+            with self.read_connection(pool) as conn:
+                cur = conn.cursor()
+                cur.execute(query, params)
+                rows = cur.fetchone() if one else cur.fetchall()
+                cur.close()
+            return rows
+
+        if self.read_pool is not None:
+            try:
+                return run(self.read_pool)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                pass
+        return run(self.pool)
+
+    def prepare_statements(self, conn) -> None:
+        """
+        PREPARE all of PREPARED_STATEMENTS in conn's session.
+        """
+        cur = conn.cursor()
         try:
-            cur = self.conn.cursor()
+            for statement in PREPARED_STATEMENTS.values():
+                cur.execute(statement)
+            conn.commit()
+        except psycopg2.Error:
+            # PREPARE is not undone by a rollback, start over on the next write
+            conn.rollback()
+            cur.execute("DEALLOCATE ALL")
+            conn.commit()
+            raise
+        finally:
+            cur.close()
+        conn.prepared = True
+
+    def execute_prepared(self, cur, name: str, params: tuple) -> None:
+        """
+        Run one of PREPARED_STATEMENTS on cur. The statements are prepared
+        the first time a connection is used for a write; a connection is
+        only used by one thread at a time, so this can not race.
+        """
+        if not cur.connection.prepared:
+            self.prepare_statements(cur.connection)
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+    def create_tables(self):
+        if self.pool is None:
+            print("Please connect to a database first")
+            return
+
+        with self.connection() as conn:
+            cur = conn.cursor()
             # CREATE TABLES
             cur.execute("""CREATE TABLE IF NOT EXISTS request (
                         id BIGSERIAL PRIMARY KEY, city VARCHAR(80) DEFAULT LOWER(NULL),
                         dt TIMESTAMP DEFAULT NOW())""")
+            # coordinate lookups have no city, they store the point instead
+            cur.execute("""ALTER TABLE request ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION,
+                                               ADD COLUMN IF NOT EXISTS lon DOUBLE PRECISION""")
             
             cur.execute("""CREATE TABLE IF NOT EXISTS response (
                         id BIGSERIAL PRIMARY KEY, request_id BIGINT NOT NULL,
                         data JSON, dt TIMESTAMP DEFAULT NOW(),
                         FOREIGN KEY (request_id) REFERENCES request(id))""")
-            self.conn.commit()
+
+            # one row per upstream observation, the primary key covers the history query
+            cur.execute("""CREATE TABLE IF NOT EXISTS observation (
+                        city VARCHAR(80) NOT NULL, observed_at TIMESTAMP NOT NULL,
+                        temp REAL NOT NULL, feels_like_temp REAL NOT NULL,
+                        PRIMARY KEY (city, observed_at) INCLUDE (temp, feels_like_temp))""")
             cur.close()
-        except AttributeError:
-            print("Please connect to a database first")
         
 
     def save_request_data(self, city_name: str, request_time: str) -> int:
@@ -54,20 +253,40 @@ class WeatherDatabase:
         - int: request_id
         """
         
-        cur = self.conn.cursor()
-        # converts a ISO format dt string into timestamp
-        cur.execute("""INSERT INTO request (city, dt) 
-                    VALUES (%s, %s)
-                    RETURNING id""",
-                    (city_name, request_time,))
-        
-        request_id = cur.fetchone()[0] 
-        cur.close()
-        self.conn.commit()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            # converts a ISO format dt string into timestamp
+            self.execute_prepared(cur, 'save_request', (city_name, request_time,))
+            
+            request_id = cur.fetchone()[0] 
+            cur.close()
 
         return request_id
         
 
+    def save_coord_request_data(self, lat: float, lon: float, request_time: str) -> int:
+        """
+        Save a coordinate lookup to the database. It has no city, so it is
+        left out of the per-city analytics.
+
+        Args:
+        - lat (float): Latitude of the location.
+        - lon (float): Longitude of the location.
+        - request_time (str): The time the request was made, in ISO format.
+
+        Returns:
+        - int: request_id
+        """
+
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self.execute_prepared(cur, 'save_coord_request', (lat, lon, request_time,))
+            request_id = cur.fetchone()[0]
+            cur.close()
+
+        return request_id
+
+
     def save_response_data(self, request_id: int, response_data: dict) -> None:
         """
         Save response data for a city to the database.
@@ -80,13 +299,54 @@ class WeatherDatabase:
         - None
         """
 
-        cur = self.conn.cursor()
-        cur.execute("""INSERT INTO response (request_id, data) 
-                    VALUES (%s, %s)
-                    RETURNING id""",
-                    (request_id, json.dumps(response_data),))
-        cur.close()
-        self.conn.commit()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self.execute_prepared(cur, 'save_response', (request_id, json.dumps(response_data),))
+            cur.close()
+
+
+    def save_observation(self, city_name: str, weather: dict) -> None:
+        """
+        Save a successful weather response to the observation history.
+        Upstream only updates every few minutes, so an observation whose
+        last_update is already stored for the city is skipped.
+
+        Args:
+        - city_name (str): The name of the city the observation is for.
+        - weather (dict): A weather response containing temp, feels_like_temp and last_update.
+
+        Returns:
+        - None
+        """
+
+        with self.connection() as conn:
+            cur = conn.cursor()
+            self.execute_prepared(cur, 'save_observation',
+                                  (city_name.lower(), weather['last_update'], weather['temp'], weather['feels_like_temp'],))
+            cur.close()
+
+
+    def get_city_history(self, city_name: str, start: dt.datetime, end: dt.datetime, step: int) -> List[Tuple[str, float, float]]:
+        """
+        Get a city's observations in [start, end), averaged over buckets of `step` seconds.
+
+        Args:
+        - city_name (str): The name of the city.
+        - start (datetime): Start of the range.
+        - end (datetime): End of the range.
+        - step (int): Bucket size in seconds.
+
+        Returns:
+        - List[Tuple[str, float, float]]: A list of tuples containing the bucket start time, average temperature and average feels like temperature.
+        """
+
+        return self.fetch("""SELECT TO_CHAR(TO_TIMESTAMP(bucket * %(step)s) AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS'),
+                                    AVG(temp), AVG(feels_like_temp)
+                             FROM (SELECT FLOOR(EXTRACT(EPOCH FROM observed_at) / %(step)s) AS bucket, temp, feels_like_temp
+                                   FROM observation
+                                   WHERE city = %(city)s AND observed_at >= %(start)s AND observed_at < %(end)s) AS o
+                             GROUP BY bucket ORDER BY bucket""",
+                          {'city': city_name.lower(), 'start': start, 'end': end, 'step': step})
 
 
     def get_request_count(self) -> int:
@@ -97,14 +357,7 @@ class WeatherDatabase:
         - int: The total number of requests made to the server.
         """
 
-        cur = self.conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM request")
-
-        count = cur.fetchone()[0]
-        self.conn.commit()
-        cur.close()
-
-        return count
+        return self.fetch("SELECT COUNT(*) FROM request", one=True)[0]
 
 
     def get_successful_request_count(self) -> int:
@@ -115,14 +368,7 @@ class WeatherDatabase:
         - int: The total number of successful requests made to the server.
         """
         
-        cur = self.conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM response WHERE CAST(data->>'status' AS INTEGER) = 200")
-
-        count = cur.fetchone()[0]
-        self.conn.commit()
-        cur.close()
-
-        return count
+        return self.fetch("SELECT COUNT(*) FROM response WHERE CAST(data->>'status' AS INTEGER) = 200", one=True)[0]
 
 
     def get_last_hour_requests(self) -> List[Tuple[str, str]]:
@@ -133,15 +379,9 @@ class WeatherDatabase:
         - List[Tuple[str, str]]: A list of tuples containing the name of the city and the time the request was made, in ISO format.
         """
 
-        cur = self.conn.cursor()
         last_hour = dt.datetime.now() - dt.timedelta(hours=1)
-        cur.execute("SELECT city, TO_CHAR(dt, 'YYYY-MM-DD HH24:MM:SS') FROM request WHERE dt >= %s", (last_hour,))
-
-        results = cur.fetchall()
-        self.conn.commit()
-        cur.close()
-
-        return results
+        return self.fetch("""SELECT city, TO_CHAR(dt, 'YYYY-MM-DD HH24:MM:SS') FROM request
+                             WHERE dt >= %s AND city IS NOT NULL""", (last_hour,))
 
 
     def get_city_request_count(self) -> List[Tuple[str, int]]:
@@ -151,18 +391,57 @@ class WeatherDatabase:
         Returns:
         - List[Tuple[str, int]]: A list of tuples containing the name of the city and the number of requests made for that city.
         """
-        cur = self.conn.cursor()
-        cur.execute("""SELECT request.city, COUNT(*) FROM request 
-                       JOIN response ON response.request_id = request.id 
-                       WHERE CAST(data->>'status' AS INTEGER) = 200 
-                       GROUP BY request.city""")
+        return self.fetch("""SELECT request.city, COUNT(*) FROM request 
+                             JOIN response ON response.request_id = request.id 
+                             WHERE CAST(data->>'status' AS INTEGER) = 200 AND request.city IS NOT NULL
+                             GROUP BY request.city""")
+
+
+    def export_requests(self, output, start: dt.datetime, end: dt.datetime, fmt: str='csv') -> None:
+        """
+        Stream requests made in [start, end) and their responses straight from
+        Postgres to output using COPY, without building rows in Python.
+
+        Args:
+        - output: A file-like object with a write() method, it receives bytes.
+        - start (datetime): Start of the range.
+        - end (datetime): End of the range.
+        - fmt (str): 'csv' (with a header line) or 'jsonl' (one JSON object per line).
 
-        result = cur.fetchall()
-        print(result)
-        self.conn.commit()
-        cur.close()
+        Returns:
+        - None
+        """
 
-        return result
+        query = """SELECT request.id, request.city, request.lat, request.lon, request.dt, response.data AS response
+                   FROM request LEFT JOIN response ON response.request_id = request.id
+                   WHERE request.dt >= %s AND request.dt < %s
+                   ORDER BY request.id"""
+        if fmt == 'csv':
+            copy = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+        elif fmt == 'jsonl':
+            # single column csv with control characters as quote and delimiter,
+            # so the JSON text is written out unescaped
+            copy = f"COPY (SELECT row_to_json(r) FROM ({query}) AS r) TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+        else:
+            raise ValueError(f"unknown export format: {fmt}")
+
+        # a dedicated connection: a long COPY must not hold up the pooled
+        # ones, and one cut short is simply closed
+        conn = None
+        if self.replica_dsn:
+            try:
+                conn = psycopg2.connect(self.replica_dsn)
+            except psycopg2.OperationalError:
+                pass
+        if conn is None:
+            conn = psycopg2.connect(**self.params)
+        try:
+            conn.set_session(readonly=True)
+            cur = conn.cursor()
+            cur.copy_expert(cur.mogrify(copy, (start, end)).decode(), output, size=C.EXPORT_CHUNK_SIZE)
+            cur.close()
+        finally:
+            conn.close()
 
 
     def get_admin_pass(self, username: str='admin') -> str:
@@ -175,11 +454,7 @@ class WeatherDatabase:
         Returns: 
         password: str
         """
-        cur = self.conn.cursor()
-        cur.execute("SELECT password FROM admin WHERE username = %s", (username,))
-        password = cur.fetchone() 
-        self.conn.commit()
-        cur.close()
+        password = self.fetch("SELECT password FROM admin WHERE username = %s", (username,), one=True)
 
         if password:
             password = password[0]
@@ -187,13 +462,16 @@ class WeatherDatabase:
 
 
     def close_conn(self) -> None:
-        self.conn.close()
+        for pool in (self.pool, self.read_pool):
+            if pool is not None:
+                pool.closeall()
+        self.pool = self.read_pool = None
 
     def __enter__(self):
         return self
     
     def __exit__(self, *args, **kwargs) -> None:
-        self.conn.close()
+        self.close_conn()
 
 
 if __name__ == "__main__":
@@ -1,19 +1,63 @@
 import requests
 import datetime
+import hashlib
 import json
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import math
+import time
+from functools import partial
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 #local import
 from weather_database import WeatherDatabase as wd
 import config as C
-from logger import Logger
+from logger import get_logger
+from lazy import per_process
+from sketches import CityStats
+from auth import PasswordCache, issue_token, verify_token
+import export
+from geo_cache import GeoGridCache
+from upstream import Upstream
+import units as U
+from admission import AdmissionController, Shed
+import tracing
+from tracing import span
 
 
-db = wd()
-db.connect_database()
-db.create_tables()
+# resources are created on first use rather than at import, so importing
+# this module (tests, the client, forked workers) opens no connections
 
+@per_process
+def get_db() -> wd:
+    db = wd()
+    db.connect_database()
+    db.create_tables()
+    return db
 
-logger = Logger()
+
+@per_process
+def get_city_stats() -> CityStats:
+    return CityStats()
+
+
+@per_process
+def get_admin_passwords() -> PasswordCache:
+    return PasswordCache(lambda username: get_db().get_admin_pass(username))
+
+
+@per_process
+def get_geo_cache() -> GeoGridCache:
+    return GeoGridCache()
+
+
+@per_process
+def get_upstream() -> Upstream:
+    return Upstream()
+
+
+@per_process
+def get_admission() -> dict:
+    return {route_class: AdmissionController(limit, C.ADMISSION_QUEUE[route_class])
+            for route_class, limit in C.ADMISSION_LIMITS.items()}
 
 
 class weatherHandler(BaseHTTPRequestHandler):
@@ -29,112 +73,367 @@ class weatherHandler(BaseHTTPRequestHandler):
         do_POST(): Handles POST requests by setting the configured city to the value in the request body.
     """
 
-    def set_header(self, status_code: int=200):
+    def set_header(self, status_code: int=200, headers: dict=None, content_type: str='application/json'):
         self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
         self.end_headers()
 
+    def write_json(self, data, status_code: int=200, headers: dict=None):
+        with span('encode'):
+            body = json.dumps(data).encode()
+        self.set_header(status_code, headers)
+        self.wfile.write(body)
+
+    def admitted(self, route_class: str, handler) -> None:
+        """
+        Run handler under the route class's concurrency limit, or answer
+        503 with Retry-After if it can not start before the request's deadline.
+
+        Clients may set their own deadline with an X-Request-Timeout header (seconds).
+        """
+        try:
+            budget = float(self.headers.get('X-Request-Timeout', C.ADMISSION_DEFAULT_DEADLINE))
+        except ValueError:
+            budget = C.ADMISSION_DEFAULT_DEADLINE
+        self.deadline = time.monotonic() + min(budget, C.ADMISSION_DEFAULT_DEADLINE)
+
+        try:
+            with get_admission()[route_class].admit(self.deadline):
+                handler()
+        except Shed as exc:
+            get_logger().warning(f"shed {route_class} request: {exc}")
+            self.write_json({'error': 'Service Unavailable'}, 503, {'Retry-After': str(exc.retry_after)})
+
+    def remaining(self) -> float:
+        """
+        Seconds left until this request's deadline, passed on to upstream calls.
+        """
+        return max(self.deadline - time.monotonic(), C.UPSTREAM_MIN_TIMEOUT)
 
     def do_GET(self):
-        self.set_header()
+        path = urlparse(self.path).path
+        if path == '/admin/load':
+            # load stats have to stay readable while the admin routes are overloaded
+            handler = self.route_get
+        else:
+            route_class = 'admin' if self.path.startswith("/admin/") else 'weather'
+            handler = partial(self.admitted, route_class, self.route_get)
+        tracing.handle(f'GET {path}', handler)
+
+    def do_POST(self):
+        tracing.handle(f'POST {urlparse(self.path).path}', partial(self.admitted, 'admin', self.route_post))
+
+    def route_get(self):
+        path = urlparse(self.path).path
         if self.path.startswith("/admin/") and self.command == "GET":
-            if self.path == "/admin/request_count":
+            if not self.admin_user():
+                get_logger().warning("admin request without a valid session")
+                self.write_json({'error': 'Unauthorized'}, 401)
+
+            elif path == "/admin/request_count":
                 self.reqest_count()
 
-            elif self.path == "/admin/successful_request_count":
+            elif path == "/admin/successful_request_count":
                 self.successful_request_count()
 
-            elif self.path == "/admin/last_hour_requests":
+            elif path == "/admin/last_hour_requests":
                 self.last_hour_requests()
             
-            elif self.path == "/admin/city_request_count":
+            elif path == "/admin/city_request_count":
                 self.city_request_count()
 
+            elif path == "/admin/distinct_cities":
+                self.distinct_cities()
+
+            elif path == "/admin/top_cities":
+                self.top_cities()
+
+            elif path == "/admin/export":
+                self.export_logs()
+
+            elif path == "/admin/load":
+                self.load()
+
+            elif path == "/admin/profile":
+                self.start_profile()
+
+            elif path == "/admin/profile/report":
+                self.write_json(tracing.profiler.report())
+
+            elif path == "/admin/slow_requests":
+                self.write_json({'requests': tracing.get_slow_requests()})
+
             else:
-                logger.warning("wrong url for admin panel!")
-                self.set_header(404)
-                self.wfile.write(json.dumps({'error': 'Not Found'}).encode())
+                get_logger().warning("wrong url for admin panel!")
+                self.write_json({'error': 'Not Found'}, 404)
+
+        elif path == "/weather":
+            self.coord_weather()
 
         elif self.path.startswith("/weather/"):
-            self.city_weather()
+            if path.endswith("/history"):
+                self.city_history()
+            else:
+                self.city_weather()
             
         else:
-            logger.warning("wrong url for weather")
-            self.set_header(404)
-            self.wfile.write(json.dumps({'error': 'Not Found'}).encode())
+            get_logger().warning("wrong url for weather")
+            self.write_json({'error': 'Not Found'}, 404)
 
 
-    def do_POST(self):
+    def route_post(self):
 
         if self.path.startswith("/admin/signin") and self.command == "POST":
-            logger.info("admin login attempt")
+            get_logger().info("admin login attempt")
             self.admin_signin()
             
         else:
-            logger.warning("post request with wrong url")
-            self.set_header(404)
-            self.wfile.write(json.dumps({'error': 'Not Found'}).encode())
+            get_logger().warning("post request with wrong url")
+            self.write_json({'error': 'Not Found'}, 404)
             
 
+    def query_params(self) -> dict:
+        return {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+    def admin_user(self):
+        """
+        Returns the admin username from the request's bearer token, or None.
+        """
+        scheme, _, token = self.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer':
+            return None
+        return verify_token(token)
+
     def admin_signin(self):
-        data = self.rfile.read(int(self.headers.get('Content-Length')))
-        rdata = eval(json.loads(data.decode()))
-        auth = self.admin_authenticator(rdata['username'], rdata['password'])
-        self.set_header(201)
-        self.wfile.write(json.dumps(auth).encode())
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError(f"negative Content-Length: {length}")
+            rdata = json.loads(self.rfile.read(length).decode())
+            if isinstance(rdata, str):
+                # older clients send the credentials JSON-encoded twice
+                rdata = json.loads(rdata)
+            username, password = rdata['username'], rdata['password']
+        except (ValueError, TypeError, KeyError):
+            get_logger().warning("malformed admin login request")
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+        if not isinstance(username, str) or not isinstance(password, str):
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+
+        with span('admin_authenticator'):
+            auth = self.admin_authenticator(username, password)
+        self.write_json(auth, 201)
 
     def city_weather(self):
-        city = self.path[9:].replace("/", "")
+        city = urlparse(self.path).path[9:].replace("/", "")
+        units = self.requested_units()
+        if units is None:
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+
+        time:str = datetime.datetime.now().isoformat()
+        db = get_db()
+        with span('save_request_data'):
+            request_id = db.save_request_data(city, time)
+        with span('get_city_weather'):
+            response = get_city_weather(city, timeout=self.remaining())
+        with span('save_response_data'):
+            db.save_response_data(request_id, response)
+        if response.get('status') == 200:
+            with span('save_observation'):
+                db.save_observation(city, response)
+            get_city_stats().record(city)
+        self.write_weather(response, units)
+
+    def coord_weather(self):
+        params = self.query_params()
+        try:
+            lat, lon = float(params['lat']), float(params['lon'])
+        except (KeyError, ValueError):
+            lat = lon = math.nan
+        units = self.requested_units()
+        if units is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+
         time:str = datetime.datetime.now().isoformat()
-        request_id = db.save_request_data(city, time)
-        response = get_city_weather(city)
-        db.save_response_data(request_id, response)
-        self.wfile.write(json.dumps(response).encode())
+        db = get_db()
+        with span('save_request_data'):
+            request_id = db.save_coord_request_data(lat, lon, time)
+        with span('get_coord_weather'):
+            timeout = self.remaining()
+            response = get_geo_cache().get(lat, lon, partial(get_coord_weather, timeout=timeout), timeout)
+        with span('save_response_data'):
+            db.save_response_data(request_id, response)
+        self.write_weather(response, units)
+
+    def requested_units(self):
+        """
+        Returns the units asked for with ?units=, or None if they are not supported.
+        """
+        units = self.query_params().get('units', C.API_UNIT)
+        return units if units in U.CONVERSIONS else None
+
+    def write_weather(self, response: dict, units: str):
+        with span('encode'):
+            body = json.dumps(U.convert_weather(response, units)).encode()
+        headers = {'ETag': f'"{hashlib.sha1(body).hexdigest()[:16]}"',
+                   'Cache-Control': cache_control(response)}
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self.set_header(304, headers)
+            return
+        self.set_header(headers=headers)
+        self.wfile.write(body)
+
+    def city_history(self):
+        city = urlparse(self.path).path[9:-len("/history")].replace("/", "")
+        params = self.query_params()
+        try:
+            end = parse_local_time(params['to']) if 'to' in params else datetime.datetime.now()
+            start = parse_local_time(params['from']) if 'from' in params else end - datetime.timedelta(days=7)
+            step = int(params.get('step', 0))
+        except ValueError:
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+        units = self.requested_units()
+        if start >= end or step < 0 or units is None:
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+
+        # widen the buckets so the response never exceeds HISTORY_MAX_POINTS
+        step = max(step, math.ceil((end - start).total_seconds() / C.HISTORY_MAX_POINTS), 1)
+        with span('get_city_history'):
+            rows = get_db().get_city_history(city, start, end, step)
+        # stored in kelvin, convert whole columns at once
+        times, temps, feels_like_temps = zip(*rows) if rows else ((), (), ())
+        data = list(zip(times, U.convert_many(temps, units), U.convert_many(feels_like_temps, units)))
+        data = {'city': city, 'step': step, 'units': units, 'history': data}
+        self.write_json(data)
+
+    def export_logs(self):
+        params = self.query_params()
+        fmt = params.get('format', 'csv')
+        try:
+            start = datetime.datetime.fromisoformat(params['from']) if 'from' in params else datetime.datetime.min
+            end = datetime.datetime.fromisoformat(params['to']) if 'to' in params else datetime.datetime.max
+        except ValueError:
+            start = end = None
+        if fmt not in export.CONTENT_TYPES or start is None:
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+
+        compress = 'gzip' in self.headers.get('Accept-Encoding', '')
+        headers = {'Content-Encoding': 'gzip'} if compress else {}
+        self.set_header(headers=headers, content_type=export.CONTENT_TYPES[fmt])
+        try:
+            export.export(get_db(), self.wfile, start, end, fmt, compress)
+        except Exception:
+            # headers are already sent, all we can do is cut the stream short
+            get_logger().error("export failed")
 
     def reqest_count(self):
-        count = db.get_request_count()
+        with span('get_request_count'):
+            count = get_db().get_request_count()
         data = {'count':count}
-        self.wfile.write(json.dumps(data).encode())
+        self.write_json(data)
 
     def successful_request_count(self):
-        count = db.get_successful_request_count()
+        with span('get_successful_request_count'):
+            count = get_db().get_successful_request_count()
         data = {'count':count}
-        self.wfile.write(json.dumps(data).encode())
+        self.write_json(data)
 
     def last_hour_requests(self):
-        data = db.get_last_hour_requests()
+        with span('get_last_hour_requests'):
+            data = get_db().get_last_hour_requests()
         data = {'requests':data}
-        self.wfile.write(json.dumps(data).encode())
+        self.write_json(data)
 
     def city_request_count(self):
-        data = db.get_city_request_count()
+        with span('get_city_request_count'):
+            data = get_db().get_city_request_count()
         data = {'requests':data}
-        self.wfile.write(json.dumps(data).encode())
+        self.write_json(data)
+
+    def distinct_cities(self):
+        count = get_city_stats().distinct_cities()
+        data = {'count':count}
+        self.write_json(data)
+
+    def top_cities(self):
+        data = get_city_stats().top_cities()
+        data = {'requests':data}
+        self.write_json(data)
+
+    def load(self):
+        data = {route_class: controller.stats() for route_class, controller in get_admission().items()}
+        self.write_json(data)
+
+    def start_profile(self):
+        """
+        Profile the next ?requests= requests, report them at /admin/profile/report.
+        """
+        try:
+            count = int(self.query_params().get('requests', C.PROFILE_DEFAULT_REQUESTS))
+        except ValueError:
+            count = 0
+        if count <= 0:
+            self.write_json({'error': 'Bad Request'}, 400)
+            return
+        tracing.profiler.arm(count)
+        get_logger().info(f"profiling the next {count} requests")
+        self.write_json({'requests': count}, 202)
 
     @classmethod
-    def admin_authenticator(cls, username: str, password: str) -> bool:
-        __password = db.get_admin_pass(username)
-        if password == __password:
-            return {'auth': True}
+    def admin_authenticator(cls, username: str, password: str) -> dict:
+        if get_admin_passwords().check(username, password):
+            return {'auth': True, 'token': issue_token(username)}
         return {'auth': False}
 
 
 
-def get_city_weather(city_name: str) -> dict:
+def get_city_weather(city_name: str, timeout: float=None) -> dict:
     """
     Retrieve weather data from an external API for a given city.
 
     Args:
     - city_name (str): The name of the city to retrieve weather data for.
+    - timeout (float): Optional upper bound in seconds for the upstream call.
 
     Returns:
     - dict: A dictionary containing weather information for the city, including temperature, feels like temperature, and last updated time.
     """
 
-    url = f'http://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={C.API_KEY}&units={C.API_UNIT}'
+    return fetch_weather(f'q={city_name}', timeout)
+
+
+def get_coord_weather(lat: float, lon: float, timeout: float=None) -> dict:
+    """
+    Retrieve weather data from an external API for a location.
+
+    Args:
+    - lat (float): Latitude of the location.
+    - lon (float): Longitude of the location.
+    - timeout (float): Optional upper bound in seconds for the upstream call.
+
+    Returns:
+    - dict: A dictionary containing weather information for the location, including temperature, feels like temperature, and last updated time.
+    """
+
+    return fetch_weather(f'lat={lat}&lon={lon}', timeout)
+
+
+def fetch_weather(query: str, timeout: float=None) -> dict:
+    """
+    Call the external API with the given location query and parse the response.
+    """
 
     try:
-        response = requests.get(url, timeout=8)
+        response = get_upstream().get(f'{query}&appid={C.API_KEY}&units={C.CANONICAL_UNIT}', timeout)
         response.raise_for_status()
         weather_info = response.json()
 
@@ -145,20 +444,55 @@ def get_city_weather(city_name: str) -> dict:
             feels_like_temp = float(main['feels_like'])
             last_updated = datetime.datetime.fromtimestamp(weather_info["dt"]).strftime('%Y-%m-%d %H:%M:%S')
 
-            weather = {'temp': temp, 'feels_like_temp': feels_like_temp, 'last_update': last_updated, 'status': response.status_code}
+            weather = {'temp': temp, 'feels_like_temp': feels_like_temp, 'last_update': last_updated,
+                       'units': C.CANONICAL_UNIT, 'status': response.status_code}
         else:
             weather = {'status': response.status_code}
         return weather
     except requests.exceptions.HTTPError as exc:
-        logger.error(f"HTTPError: {exc}")
+        get_logger().error(f"HTTPError: {exc}")
         exc_message = {"status": exc.response.status_code}
         response.close()
         return exc_message
     except requests.exceptions.Timeout:
-        logger.error("Timeout: 408")
+        get_logger().error("Timeout: 408")
         exc_message = {"status": 408}
         return exc_message
+    except requests.exceptions.RequestException as exc:
+        # every provider failed, e.g. none of them could be reached
+        get_logger().error(f"{type(exc).__name__}: 503")
+        exc_message = {"status": 503}
+        return exc_message
+
+
+
+def parse_local_time(value: str) -> datetime.datetime:
+    """
+    Parse an ISO 8601 time as a naive local time, like the stored observation
+    times. A time with a UTC offset (or Z) is converted to local time.
+    """
+
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def cache_control(weather: dict) -> str:
+    """
+    Build the Cache-Control header for a weather response.
+
+    Upstream observations are refreshed every C.WEATHER_REFRESH_INTERVAL
+    seconds, so a successful response stays fresh until that long after
+    its last_update. Errors are never cached.
+    """
 
+    if weather.get('status') != 200:
+        return 'no-store'
+    last_update = datetime.datetime.strptime(weather['last_update'], '%Y-%m-%d %H:%M:%S')
+    expires = last_update + datetime.timedelta(seconds=C.WEATHER_REFRESH_INTERVAL)
+    max_age = int((expires - datetime.datetime.now()).total_seconds())
+    return f'max-age={max(max_age, 0)}'
 
 
 def start_server() -> None:
@@ -166,17 +500,19 @@ def start_server() -> None:
     Start the weather server.
     """
    
+    # connect and check tables before accepting requests, not at import
+    get_db()
     server_address = ('localhost', 8000)
-    with HTTPServer(server_address, weatherHandler) as server:
+    with ThreadingHTTPServer(server_address, weatherHandler) as server:
         print('Server running at http://localhost:8000/')
-        logger.info("server running")
+        get_logger().info("server running")
         server.serve_forever()
 
 
 if __name__ == "__main__":
     try:
         start_server()
-        logger.info("server running")
+        get_logger().info("server running")
     except:
-        logger.error("server shutdown due to an exception")
+        get_logger().error("server shutdown due to an exception")
     
\ No newline at end of file